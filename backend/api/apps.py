@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.conf import settings
+        from django.core.signals import request_finished, request_started
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .db_health import check_idle_connections, mark_connections_used
+        from .middleware import install_query_counter
+
+        if settings.DB_HEALTH_CHECK_INTERVAL:
+            request_started.connect(check_idle_connections)
+            request_finished.connect(mark_connections_used)
+        if settings.API_METRICS:
+            connection_created.connect(install_query_counter)
@@ -0,0 +1,57 @@
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+
+def run_view(view, request, *args, **kwargs):
+    """
+    Выполняет синхронное представление и отрисовку ответа
+    в потоке пула со своим соединением с БД. Время отрисовки
+    сохраняется для QueryMetricsMiddleware.
+    """
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            render_start = time.perf_counter()
+            response = response.render()
+            request.metrics_render = (render_start, time.perf_counter())
+        return response
+    finally:
+        close_old_connections()
+
+
+def offload(view):
+    """
+    Асинхронная обертка представления DRF для ASGI.
+
+    Запросы к БД и сериализация выполняются в общем пуле потоков
+    (thread_sensitive=False), а не в единственном потоке для
+    синхронного кода, поэтому под ASGI несколько чтений идут
+    параллельно, а отдача ответа медленным клиентам не занимает поток.
+    Django 3.2 не имеет асинхронного ORM, поэтому запросы остаются
+    синхронными.
+    """
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(run_view, thread_sensitive=False)(
+            view, request, *args, **kwargs)
+
+    return async_view
+
+
+def offload_patterns(patterns, names):
+    """
+    Заменяет представления маршрутов с указанными именами
+    на асинхронные обертки.
+    """
+    return [
+        URLPattern(pattern.pattern, offload(pattern.callback),
+                   pattern.default_args, pattern.name)
+        if isinstance(pattern, URLPattern) and pattern.name in names
+        else pattern
+        for pattern in patterns
+    ]
@@ -0,0 +1,76 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_CACHE_KEY_PREFIX = 'auth_token'
+
+# Поля пользователя, которые хранятся в кэше. Пароль и прочие поля
+# не кэшируются и загружаются из базы при обращении к ним
+CACHED_USER_FIELDS = ('id', 'username', 'email', 'first_name',
+                      'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def get_token_cache():
+    return caches[settings.TOKEN_CACHE_ALIAS]
+
+
+def token_cache_key(key):
+    """
+    Ключ кэша для токена: в кэше хранится хэш, а не сам токен.
+    """
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'{TOKEN_CACHE_KEY_PREFIX}:{digest}'
+
+
+def invalidate_tokens(*keys):
+    """Удаляет из кэша пользователей, найденных по токенам."""
+    if keys:
+        get_token_cache().delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену с кэшированием пользователя.
+
+    В кэше хранятся только поля CACHED_USER_FIELDS, без хэша пароля.
+    Пользователь восстанавливается без запроса, остальные поля
+    отложены: они читаются из базы при обращении, а save() сохраняет
+    только загруженные поля. Запрос к токену и пользователю
+    выполняется только при промахе, запись живет TOKEN_CACHE_TIMEOUT
+    секунд. Кэш сбрасывается сигналами при удалении токена (выход)
+    и при сохранении пользователя (смена пароля, деактивация),
+    см. api.signals.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        values = get_token_cache().get(cache_key)
+        if values is None:
+            user, token = super().authenticate_credentials(key)
+            get_token_cache().set(
+                cache_key,
+                {field: getattr(user, field) for field in CACHED_USER_FIELDS},
+                settings.TOKEN_CACHE_TIMEOUT)
+            return user, token
+        user = self.restore_user(values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                'User inactive or deleted.')
+        return user, self.get_model()(key=key, user=user)
+
+    @staticmethod
+    def restore_user(values):
+        """
+        Пользователь из закэшированных полей, остальные поля отложены.
+        from_db ожидает значения в порядке полей модели.
+        """
+        model = get_user_model()
+        field_names = [field.attname for field in model._meta.concrete_fields
+                       if field.attname in values]
+        return model.from_db(DEFAULT_DB_ALIAS, field_names,
+                             [values[name] for name in field_names])
@@ -0,0 +1,113 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+
+from recipes.models import Ingredient
+from .db_router import primary_reads
+from .versions import bump_version, get_versions, version_key
+
+EXACT, PREFIX, SUBSTRING = range(3)
+
+
+class IngredientIndex:
+    """
+    Отсортированный префиксный индекс ингредиентов в памяти процесса.
+
+    Ключи — названия в нижнем регистре; префиксный поиск выполняется
+    бинарным поиском, поиск по подстроке — проходом по индексу.
+    Индекс перестраивается при смене версии модели Ingredient
+    (см. api.versions), общей для всех процессов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._ingredients = []
+
+    @staticmethod
+    def invalidate():
+        """
+        Помечает индексы всех процессов как устаревшие.
+        """
+        bump_version(version_key(Ingredient))
+
+    def _ensure_fresh(self):
+        version, = get_versions(version_key(Ingredient))
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            # Индекс живет до смены версии, поэтому строится по основной
+            # базе: реплика может еще не содержать новых ингредиентов
+            with primary_reads():
+                rows = sorted(
+                    (name.lower(), name, pk, unit)
+                    for pk, name, unit in Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit').iterator()
+                )
+            self._keys = [row[0] for row in rows]
+            self._ingredients = [
+                Ingredient(id=pk, name=name, measurement_unit=unit)
+                for _, name, pk, unit in rows]
+            self._version = version
+
+    def search(self, query, limit):
+        """
+        Ищет ингредиенты: сначала точные совпадения,
+        затем по префиксу, затем по подстроке.
+        """
+        self._ensure_fresh()
+        keys, ingredients = self._keys, self._ingredients
+        query = query.lower()
+        ranked = ([], [], [])
+        position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            rank = EXACT if keys[position] == query else PREFIX
+            ranked[rank].append(ingredients[position])
+            position += 1
+        found = len(ranked[EXACT]) + len(ranked[PREFIX])
+        if found < limit:
+            for key, ingredient in zip(keys, ingredients):
+                if query in key and not key.startswith(query):
+                    ranked[SUBSTRING].append(ingredient)
+                    found += 1
+                    if found >= limit:
+                        break
+        return [ingredient for group in ranked for ingredient in group][:limit]
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_ingredients_in_database(queryset, query, limit):
+    """
+    Поиск ингредиентов запросом к БД с тем же ранжированием.
+
+    На PostgreSQL условия icontains/istartswith обслуживаются
+    триграммным GIN-индексом по UPPER(name).
+    """
+    return queryset.filter(
+        name__icontains=query
+    ).annotate(
+        rank=Case(
+            When(name__iexact=query, then=Value(EXACT)),
+            When(name__istartswith=query, then=Value(PREFIX)),
+            default=Value(SUBSTRING),
+            output_field=IntegerField()
+        )
+    ).order_by('rank', 'name')[:limit]
+
+
+def search_ingredients(queryset, query, limit):
+    """
+    Автодополнение ингредиентов по названию.
+    """
+    if (settings.INGREDIENT_AUTOCOMPLETE_BACKEND == 'database'
+            and connection.vendor == 'postgresql'):
+        return search_ingredients_in_database(queryset, query, limit)
+    return ingredient_index.search(query, limit)
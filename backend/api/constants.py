@@ -15,3 +15,35 @@ MAX_TIME = 240
 
 # Минимальное допустимое веса ингредиентов/времени приготовления
 MINIMUM = 1
+
+# Размер порции строк при чтении списка покупок из курсора
+SHOPPING_LIST_CHUNK_SIZE = 500
+
+# Параметры страницы PDF со списком покупок
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+
+# Максимальное количество ингредиентов в ответе автодополнения
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Время кэширования ответов для анонимных пользователей (секунды)
+ANONYMOUS_CACHE_MAX_AGE = 60
+
+# Уменьшенные копии фото рецепта: название и наибольшая сторона (пиксели)
+IMAGE_VARIANTS = {'thumbnail': 320, 'medium': 960}
+
+# Качество сжатия уменьшенных копий JPEG и WebP
+IMAGE_VARIANT_QUALITY = 82
+
+# Длина блока base64 при потоковом декодировании изображений (кратна 4)
+BASE64_CHUNK_SIZE = 64 * 1024
+
+# Наибольшая длина заголовка data:image/<тип>;base64,
+BASE64_HEADER_MAX_LENGTH = 64
+
+# Максимальное количество рецептов в пакетном запросе избранного/корзины
+RECIPE_BATCH_LIMIT = 100
+
+# Размер пачки рецептов при исправлении счетчиков
+RECONCILE_BATCH_SIZE = 500
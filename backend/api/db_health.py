@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.db import connections
+
+# Атрибут соединения со временем окончания последнего запроса
+LAST_USED_ATTRIBUTE = 'foodgram_last_used'
+
+
+def check_idle_connections(**kwargs):
+    """
+    Закрывает постоянные соединения, которые простаивали дольше
+    DB_HEALTH_CHECK_INTERVAL и перестали отвечать, например после
+    перезапуска PostgreSQL или pgbouncer. Запрос откроет новое.
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        last_used = getattr(connection, LAST_USED_ATTRIBUTE, now)
+        if now - last_used < settings.DB_HEALTH_CHECK_INTERVAL:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+def mark_connections_used(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            setattr(connection, LAST_USED_ATTRIBUTE, now)
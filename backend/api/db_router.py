@@ -0,0 +1,65 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.authtoken.models import Token
+
+# Разрешено ли читать из реплики в текущем запросе,
+# выставляется ReplicaRoutingMiddleware
+replica_reads = ContextVar('replica_reads', default=False)
+
+# Модели, которые всегда читаются из основной базы: только что
+# выданный токен может еще не дойти до реплики
+PRIMARY_ONLY_MODELS = (Token,)
+
+
+def replica_may_lag(*versions):
+    """
+    Могут ли реплики еще не содержать изменений с такими версиями
+    (api.versions): чтение из реплик разрешено, а изменения моложе
+    REPLICA_MAX_LAG_SECONDS. Прочитанное из реплики в этом случае
+    нельзя класть в кэши с ключами по этим версиям — устаревшие
+    данные отдавались бы под новой версией.
+    """
+    return (bool(settings.REPLICA_DATABASES)
+            and replica_reads.get()
+            and time.time() - max(versions)
+            < settings.REPLICA_MAX_LAG_SECONDS)
+
+
+@contextmanager
+def primary_reads():
+    """Чтение только из основной базы внутри блока."""
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Отправляет чтение в случайную реплику, если это разрешено
+    для запроса и нет открытой транзакции в основной базе.
+    Запись, миграции и все вне HTTP-запросов — в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (not settings.REPLICA_DATABASES
+                or not replica_reads.get()
+                or issubclass(model, PRIMARY_ONLY_MODELS)
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
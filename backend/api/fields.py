@@ -1,26 +1,113 @@
-import base64
+import binascii
 import re
+from base64 import b64decode
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 from rest_framework.serializers import ImageField
 
+from .constants import BASE64_CHUNK_SIZE, BASE64_HEADER_MAX_LENGTH
+
 
 class Base64ImageField(ImageField):
-    """Сериализатор изображений"""
+    """
+    Сериализатор изображений.
+
+    При указании variant отдает ссылку на уменьшенную копию
+    из image_variants объекта, пока ее нет — на оригинал.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Ожидается изображение в формате '
+                          'data:image/<тип>;base64,<данные>.',
+        'too_large': 'Размер изображения превышает {max_size} байт.',
+        'too_many_pixels': 'Размер изображения превышает '
+                           '{max_side}x{max_side} пикселей.',
+    }
+
+    _base64_header_pattern = re.compile(
+        r"data:image/(?P<extension>\w+);base64$")
 
-    _base64_image_pattern = re.compile(
-        r"data:image/(?P<extension>\w+);base64,(?P<encoded_image>.*)")
+    def __init__(self, *args, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(*args, **kwargs)
+
+    def to_representation(self, value):
+        variants = getattr(getattr(value, 'instance', None),
+                           'image_variants', None) or {}
+        if not value or self.variant not in variants:
+            return super().to_representation(value)
+        url = value.storage.url(variants[self.variant])
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
 
     def to_internal_value(self, base64_data):
         """Преобразует base64-кодированное
         изображение во внутреннее значение"""
-        if isinstance(base64_data, str):
-            match = self._base64_image_pattern.match(base64_data)
-            if match:
-                extension = match.group("extension")
-                encoded_image = match.group("encoded_image")
-                decoded_image = base64.b64decode(encoded_image)
-                content_file = ContentFile(decoded_image,
-                                           name=f"temp.{extension}")
-
-        return super().to_internal_value(content_file)
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        header, _, _ = base64_data[:BASE64_HEADER_MAX_LENGTH].partition(',')
+        match = self._base64_header_pattern.match(header)
+        if not match:
+            self.fail('invalid_base64')
+        start = len(header) + 1
+        size = self.get_decoded_size(base64_data, start)
+        if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
+
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        checked = False
+        try:
+            for position in range(start, len(base64_data),
+                                  BASE64_CHUNK_SIZE):
+                chunk = b64decode(
+                    base64_data[position:position + BASE64_CHUNK_SIZE],
+                    validate=True)
+                if position == start:
+                    checked = self.check_dimensions(BytesIO(chunk))
+                file.write(chunk)
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        if not checked:
+            self.check_dimensions(file)
+            file.seek(0)
+        extension = match.group('extension')
+        return super().to_internal_value(UploadedFile(
+            file, name=f'temp.{extension}',
+            content_type=f'image/{extension}', size=size))
+
+    @staticmethod
+    def get_decoded_size(base64_data, start):
+        """
+        Размер данных после декодирования, без самого декодирования.
+        """
+        padding = len(base64_data) - len(base64_data.rstrip('='))
+        return (len(base64_data) - start) // 4 * 3 - min(padding, 2)
+
+    def check_dimensions(self, file):
+        """
+        Проверяет размеры по заголовку изображения без декодирования
+        пикселей. Возвращает False, если заголовок прочитать не удалось.
+        Защита Pillow от «бомб распаковки» срабатывает уже при чтении
+        заголовка (предупреждение — если оно превращено в исключение),
+        такие изображения тоже отклоняются по размеру.
+        """
+        max_side = settings.IMAGE_UPLOAD_MAX_SIDE
+        try:
+            width, height = Image.open(file).size
+        except (Image.DecompressionBombError,
+                Image.DecompressionBombWarning):
+            self.fail('too_many_pixels', max_side=max_side)
+        except (OSError, SyntaxError):
+            return False
+        if width > max_side or height > max_side:
+            self.fail('too_many_pixels', max_side=max_side)
+        return True
@@ -1,7 +1,10 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
-from recipes.models import Recipe, Tag
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from .autocomplete import search_ingredients
+from .constants import INGREDIENT_SEARCH_LIMIT
 
 
 class RecipeSearchFilter(FilterSet):
@@ -14,6 +17,7 @@ class RecipeSearchFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags'
     )
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited'
@@ -21,6 +25,20 @@ class RecipeSearchFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'Популярные'),),
+        method='filter_ordering'
+    )
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Фильтрует рецепты по любому из тегов подзапросом
+        к промежуточной таблице, без дублирования строк.
+        """
+        if not value:
+            return queryset
+        return queryset.filter(pk__in=Recipe.tags.through.objects.filter(
+            tag__in=value).values('recipe_id'))
 
     def filter_is_favorited(self, queryset, name, value):
         """
@@ -38,25 +56,47 @@ class RecipeSearchFilter(FilterSet):
             return self._filter_by_in_shopping_cart(queryset)
         return queryset
 
+    def filter_ordering(self, queryset, name, value):
+        """
+        Сортирует рецепты по популярности (счетчикам на рецепте).
+        """
+        if value == 'popular':
+            return queryset.order_by('-favorites_count',
+                                     '-shopping_carts_count',
+                                     '-pub_date')
+        return queryset
+
     def _filter_by_favorited(self, queryset):
         """
         Фильтрует рецепты по статусу добавленных в избранное
         (внутренний метод).
         """
-        return queryset.filter(in_favorites__user=self.request.user)
+        return queryset.filter(Exists(Favorite.objects.filter(
+            user=self.request.user, recipe=OuterRef('pk'))))
 
     def _filter_by_in_shopping_cart(self, queryset):
         """
         Фильтрует рецепты по статусу наличия в корзине покупок
         (внутренний метод).
         """
-        return queryset.filter(in_shopping_carts__user=self.request.user)
+        return queryset.filter(Exists(ShoppingCart.objects.filter(
+            user=self.request.user, recipe=OuterRef('pk'))))
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'ordering')
 
 
-class IngredientSearchFilter(SearchFilter):
-    """Фильтр ингредиентов по названию."""
+class IngredientSearchFilter(BaseFilterBackend):
+    """
+    Фильтр ингредиентов по названию: автодополнение
+    по префиксному индексу с ограничением числа результатов.
+    """
     search_param = 'name'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query or view.action != 'list':
+            return queryset
+        return search_ingredients(queryset, query, INGREDIENT_SEARCH_LIMIT)
@@ -0,0 +1,123 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+from .constants import IMAGE_VARIANT_QUALITY, IMAGE_VARIANTS
+from .versions import bump_version, version_key
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+WEBP_SUFFIX = '.webp'
+
+
+class ImageVariantService:
+    """
+    Сервис для нарезки уменьшенных копий фото рецептов вне запроса.
+
+    Копии JPEG сохраняются рядом с оригиналом в каталоге variants,
+    рядом с каждой лежит WebP с суффиксом .webp, который nginx
+    отдает браузерам с Accept: image/webp. Пути копий JPEG
+    записываются в Recipe.image_variants.
+    """
+    _executor = None
+
+    @classmethod
+    def get_executor(cls):
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                thread_name_prefix='image-variants')
+        return cls._executor
+
+    @classmethod
+    def schedule(cls, recipe, previous_variants=None):
+        """
+        Ставит нарезку копий в очередь после фиксации транзакции.
+        previous_variants — копии прежнего фото, которые удаляются.
+        """
+        if not recipe.image:
+            return
+        recipe_id, image_name = recipe.pk, recipe.image.name
+        previous_variants = previous_variants or {}
+
+        def submit():
+            if settings.IMAGE_VARIANT_WORKERS:
+                cls.get_executor().submit(cls.run, recipe_id, image_name,
+                                          previous_variants)
+            else:
+                recipe.image_variants = cls.process(recipe_id, image_name,
+                                                    previous_variants)
+
+        transaction.on_commit(submit)
+
+    @classmethod
+    def run(cls, recipe_id, image_name, previous_variants=None):
+        try:
+            cls.process(recipe_id, image_name, previous_variants)
+        except Exception:
+            logger.exception('Не удалось нарезать фото рецепта %s',
+                             recipe_id)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def get_variant_name(image_name, variant):
+        directory, filename = posixpath.split(image_name)
+        # Расширение остается в имени: temp.png и temp.jpeg
+        # не должны давать один и тот же файл копии
+        stem = filename.replace('.', '_')
+        return posixpath.join(directory, VARIANTS_DIR,
+                              f'{stem}_{variant}.jpg')
+
+    @staticmethod
+    def delete_variants(storage, variants):
+        """Удаляет файлы копий JPEG и WebP."""
+        for name in variants.values():
+            for path in (name, name + WEBP_SUFFIX):
+                if storage.exists(path):
+                    storage.delete(path)
+
+    @classmethod
+    def process(cls, recipe_id, image_name, previous_variants=None):
+        """
+        Нарезает копии фото и сохраняет их пути в рецепте,
+        если фото не сменилось за время обработки. Копии прежнего
+        фото удаляются до записи новых, а копии фото, замененного
+        за время обработки, — после.
+        """
+        storage = Recipe._meta.get_field('image').storage
+        cls.delete_variants(storage, previous_variants or {})
+        with storage.open(image_name) as file:
+            original = Image.open(file)
+            original.load()
+        original = ImageOps.exif_transpose(original).convert('RGB')
+
+        variants = {}
+        for variant, size in IMAGE_VARIANTS.items():
+            image = original.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            name = cls.get_variant_name(image_name, variant)
+            for path, image_format in ((name, 'JPEG'),
+                                       (name + WEBP_SUFFIX, 'WEBP')):
+                buffer = BytesIO()
+                image.save(buffer, image_format,
+                           quality=IMAGE_VARIANT_QUALITY, optimize=True)
+                if storage.exists(path):
+                    storage.delete(path)
+                storage.save(path, ContentFile(buffer.getvalue()))
+            variants[variant] = name
+
+        if Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+                image_variants=variants):
+            bump_version(version_key(Recipe, recipe_id))
+        else:
+            cls.delete_variants(storage, variants)
+        return variants
@@ -0,0 +1,85 @@
+from django.db import connections, router
+from django.http import Http404
+
+
+def parse_id(value):
+    """
+    Идентификатор объекта из URL, 404 для нечисловых значений.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
+
+
+def insert_link(model, user_id, target_field, target_id):
+    """
+    Создает связь пользователя с объектом одной командой.
+    Возвращает True, если связь создана. Сигналы не отправляются.
+    """
+    return bool(insert_links(model, user_id, target_field, [target_id]))
+
+
+def insert_links(model, user_id, target_field, target_ids):
+    """
+    Создает связи пользователя с объектами одной командой
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING: строки
+    вставляются, только если объект существует и связи еще нет.
+    Возвращает множество id объектов, для которых связь действительно
+    создана этой командой, поэтому при параллельных запросах каждая
+    связь учитывается ровно один раз. Сигналы не отправляются.
+    """
+    if not target_ids:
+        return set()
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    target = model._meta.get_field(target_field)
+    target_meta = target.related_model._meta
+    instance = model()
+    columns, values, params = [], [], []
+    for field in model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        columns.append(quote(field.column))
+        if field.name == target_field:
+            values.append(quote(target_meta.pk.column))
+            continue
+        values.append('%s')
+        if field.name == 'user':
+            params.append(user_id)
+        else:
+            params.append(field.get_db_prep_save(
+                field.pre_save(instance, add=True), connection))
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    sql = (f'INSERT INTO {quote(model._meta.db_table)} '
+           f'({", ".join(columns)}) '
+           f'SELECT {", ".join(values)} '
+           f'FROM {quote(target_meta.db_table)} '
+           f'WHERE {quote(target_meta.pk.column)} IN ({placeholders}) '
+           'ON CONFLICT DO NOTHING '
+           f'RETURNING {quote(target.column)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, *target_ids])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def delete_links(model, user_id, target_field, target_ids):
+    """
+    Удаляет связи пользователя с объектами одной командой
+    DELETE ... RETURNING. Возвращает множество id объектов, связи
+    с которыми удалены именно этой командой. Сигналы не отправляются.
+    """
+    if not target_ids:
+        return set()
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    target = model._meta.get_field(target_field)
+    user_column = model._meta.get_field('user').column
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    sql = (f'DELETE FROM {quote(model._meta.db_table)} '
+           f'WHERE {quote(user_column)} = %s '
+           f'AND {quote(target.column)} IN ({placeholders}) '
+           f'RETURNING {quote(target.column)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *target_ids])
+        return {row[0] for row in cursor.fetchall()}
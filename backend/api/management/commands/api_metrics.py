@@ -0,0 +1,54 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.metrics import EndpointMetrics, percentile
+
+COLUMNS = ('total_ms', 'db_ms', 'view_ms', 'serialize_ms', 'render_ms',
+           'queries', 'size_bytes')
+
+
+class Command(BaseCommand):
+    """Команда для вывода гистограмм метрик эндпоинтов API."""
+
+    help = ('Выводит накопленные QueryMetricsMiddleware метрики '
+            'по эндпоинтам: среднее, p50, p95 и максимум.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true',
+                            help='Вывести гистограммы в формате JSON.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Удалить накопленные метрики.')
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        directory = settings.API_METRICS_DIR
+        if options['reset']:
+            EndpointMetrics.reset(directory)
+            self.stdout.write(self.style.SUCCESS('Метрики удалены.'))
+            return
+        stats = EndpointMetrics.load(directory)
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2, sort_keys=True))
+            return
+        if not stats:
+            self.stdout.write('Метрик пока нет: включите API_METRICS=true.')
+            return
+        for endpoint, metrics in sorted(
+                stats.items(),
+                key=lambda item: -item[1]['total_ms']['sum']):
+            requests = metrics['total_ms']['count']
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{endpoint}: запросов {requests}'))
+            for metric in COLUMNS:
+                histogram = metrics.get(metric)
+                if not histogram or not histogram['count']:
+                    continue
+                mean = histogram['sum'] / histogram['count']
+                self.stdout.write(
+                    f'  {metric:<12}'
+                    f' mean={mean:9.1f}'
+                    f' p50<={percentile(histogram, metric, 0.5):>8}'
+                    f' p95<={percentile(histogram, metric, 0.95):>8}'
+                    f' max={histogram["max"]:9.1f}')
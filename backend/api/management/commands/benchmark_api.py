@@ -0,0 +1,147 @@
+import json
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Команда для замера основных эндпоинтов API."""
+
+    help = ('Замеряет время ответа и число SQL-запросов основных '
+            'эндпоинтов через тестовый клиент Django и сохраняет '
+            'результат в JSON для сравнения между коммитами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--output', help='Файл для сохранения JSON.')
+        parser.add_argument('--baseline',
+                            help='JSON прошлого замера для сравнения.')
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        user = User.objects.filter(
+            shopping_carts__isnull=False,
+            subscription__isnull=False).first()
+        recipe = Recipe.objects.first()
+        ingredient = Ingredient.objects.first()
+        if user is None or recipe is None or ingredient is None:
+            raise CommandError('Нет данных: запустите generate_data.')
+        token, _ = Token.objects.get_or_create(user=user)
+
+        anonymous = Client()
+        authorized = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        search = ingredient.name[:3]
+        scenarios = (
+            ('recipes_list_anonymous', anonymous, '/api/recipes/'),
+            ('recipes_list', authorized, '/api/recipes/'),
+            ('recipes_list_page_10', authorized, '/api/recipes/?page=10'),
+            ('recipes_list_cursor', authorized,
+             '/api/recipes/?pagination=cursor'),
+            ('recipes_list_tags', authorized,
+             '/api/recipes/?tags=breakfast&tags=lunch'),
+            ('recipe_detail', authorized, f'/api/recipes/{recipe.pk}/'),
+            ('tags', anonymous, '/api/tags/'),
+            ('ingredients_search', anonymous,
+             f'/api/ingredients/?name={search}'),
+            ('users_list', authorized, '/api/users/'),
+            ('subscriptions', authorized,
+             '/api/users/subscriptions/?recipes_limit=3'),
+            ('shopping_cart_txt', authorized,
+             '/api/recipes/download_shopping_cart/'),
+            ('shopping_cart_csv', authorized,
+             '/api/recipes/download_shopping_cart/?format=csv'),
+        )
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        results = {}
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for name, client, url in scenarios:
+                results[name] = self.measure(client, url,
+                                             options['iterations'],
+                                             options['warmup'])
+                self.stdout.write(self.format_result(name, results[name]))
+
+        report = {'meta': self.get_meta(options), 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                self.compare(json.load(file)['results'], results)
+
+    @staticmethod
+    def measure(client, url, iterations, warmup):
+        for _ in range(warmup):
+            Command.consume(client.get(url))
+        timings = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url)
+                size = len(Command.consume(response))
+                timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return {
+            'url': url,
+            'status': response.status_code,
+            'queries': len(queries),
+            'size_bytes': size,
+            'mean_ms': round(statistics.mean(timings), 2),
+            'p50_ms': round(timings[len(timings) // 2], 2),
+            'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 2),
+            'min_ms': round(timings[0], 2),
+        }
+
+    @staticmethod
+    def consume(response):
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    @staticmethod
+    def get_meta(options):
+        try:
+            commit = subprocess.run(
+                ('git', 'rev-parse', '--short', 'HEAD'),
+                capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+        }
+
+    @staticmethod
+    def format_result(name, result):
+        return (f'{name:<24} {result["status"]} '
+                f'queries={result["queries"]:<4} '
+                f'mean={result["mean_ms"]:8.2f}ms '
+                f'p95={result["p95_ms"]:8.2f}ms')
+
+    def compare(self, baseline, results):
+        self.stdout.write(self.style.MIGRATE_HEADING('Сравнение с baseline:'))
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            change = ((result['p50_ms'] - before['p50_ms'])
+                      / before['p50_ms'] * 100 if before['p50_ms'] else 0)
+            line = (f'{name:<24} p50 {before["p50_ms"]:8.2f} -> '
+                    f'{result["p50_ms"]:8.2f}ms ({change:+.1f}%), '
+                    f'queries {before["queries"]} -> {result["queries"]}')
+            if result['queries'] > before['queries'] or change > 10:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ('/api/recipes/', '/api/recipes/?page=2', '/api/tags/',
+                 '/api/ingredients/?name=a')
+
+
+class Command(BaseCommand):
+    """Команда для нагрузочного замера работающего сервера."""
+
+    help = ('Открывает --concurrency одновременных соединений к серверу '
+            '(WSGI через gunicorn или ASGI через uvicorn) и замеряет '
+            'пропускную способность и задержки. --slow-read имитирует '
+            'медленных клиентов, читающих ответ по частям.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Например, http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Путь запроса, можно указать несколько.')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--slow-read', type=float, default=0,
+                            help='Пауза (с) между чтениями по 1 КБ.')
+        parser.add_argument('--token', help='Токен для авторизации.')
+        parser.add_argument('--output', help='Файл для сохранения JSON.')
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Поддерживается только http://host:port.')
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.paths = options['paths'] or DEFAULT_PATHS
+        self.slow_read = options['slow_read']
+        self.headers = f'Host: {url.netloc}\r\nConnection: close\r\n'
+        if options['token']:
+            self.headers += f'Authorization: Token {options["token"]}\r\n'
+
+        result = asyncio.run(self.run(options['concurrency'],
+                                      options['duration']))
+        result.update(url=options['url'],
+                      concurrency=options['concurrency'],
+                      slow_read=self.slow_read)
+        self.stdout.write(json.dumps(result, indent=2))
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(result, file, indent=2)
+
+    async def run(self, concurrency, duration):
+        self.latencies = []
+        self.errors = 0
+        deadline = time.perf_counter() + duration
+        start = time.perf_counter()
+        await asyncio.gather(*(self.client(number, deadline)
+                               for number in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        latencies = sorted(self.latencies)
+        if not latencies:
+            raise CommandError(f'Нет успешных ответов, ошибок: '
+                               f'{self.errors}.')
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'mean_ms': round(statistics.mean(latencies), 1),
+            'p50_ms': round(latencies[len(latencies) // 2], 1),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 1),
+            'max_ms': round(latencies[-1], 1),
+        }
+
+    async def client(self, number, deadline):
+        while time.perf_counter() < deadline:
+            path = self.paths[number % len(self.paths)]
+            number += 1
+            start = time.perf_counter()
+            try:
+                status = await self.request(path)
+            except OSError:
+                status = None
+            if status == 200:
+                self.latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                self.errors += 1
+
+    async def request(self, path):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(f'GET {path} HTTP/1.1\r\n{self.headers}\r\n'
+                         .encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            while await reader.read(1024):
+                if self.slow_read:
+                    await asyncio.sleep(self.slow_read)
+        finally:
+            writer.close()
+        parts = status_line.split()
+        return int(parts[1]) if len(parts) > 1 else None
@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+DEFAULT_PATHS = ('/api/tags/', '/api/ingredients/?name=a')
+
+
+class Command(BaseCommand):
+    """Команда для сравнения соединения на запрос и постоянных соединений."""
+
+    help = ('Прогоняет запросы через WSGIHandler, как это делает gunicorn, '
+            'сначала с CONN_MAX_AGE=0, затем с постоянным соединением, '
+            'и сравнивает пропускную способность.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--path', action='append', dest='paths')
+        parser.add_argument('--conn-max-age', type=int, default=60)
+        parser.add_argument('--output', help='Файл для сохранения JSON.')
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        self.handler = WSGIHandler()
+        self.factory = RequestFactory()
+        paths = options['paths'] or DEFAULT_PATHS
+        connection = connections['default']
+        initial_max_age = connection.settings_dict['CONN_MAX_AGE']
+        results = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for name, max_age in (('per_request', 0),
+                                      ('persistent',
+                                       options['conn_max_age'])):
+                    connection.close()
+                    connection.settings_dict['CONN_MAX_AGE'] = max_age
+                    results[name] = self.measure(paths, options['requests'])
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = initial_max_age
+        results['vendor'] = connection.vendor
+        results['speedup'] = round(
+            results['persistent']['requests_per_second']
+            / results['per_request']['requests_per_second'], 2)
+        self.stdout.write(json.dumps(results, indent=2))
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+    def measure(self, paths, count):
+        timings = []
+        start = time.perf_counter()
+        for number in range(count):
+            path, _, query = paths[number % len(paths)].partition('?')
+            environ = self.factory.get(path, QUERY_STRING=query).environ
+            request_start = time.perf_counter()
+            response = self.handler(environ, lambda *args: None)
+            b''.join(response)
+            # Как WSGI-сервер: close() отправляет request_finished
+            response.close()
+            timings.append((time.perf_counter() - request_start) * 1000)
+        elapsed = time.perf_counter() - start
+        timings.sort()
+        return {
+            'requests_per_second': round(count / elapsed, 1),
+            'p50_ms': round(timings[len(timings) // 2], 2),
+            'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 2),
+        }
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Границы корзин гистограмм: миллисекунды, количество запросов, байты
+BUCKETS = {
+    'total_ms': (5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+    'db_ms': (1, 5, 10, 25, 50, 100, 250, 500, 1000),
+    'view_ms': (1, 5, 10, 25, 50, 100, 250, 500, 1000),
+    'serialize_ms': (1, 5, 10, 25, 50, 100, 250, 500),
+    'render_ms': (1, 5, 10, 25, 50, 100, 250, 500),
+    'queries': (1, 2, 5, 10, 20, 50, 100, 200),
+    'size_bytes': (1024, 4096, 16384, 65536, 262144, 1048576),
+}
+
+SNAPSHOT_PREFIX = 'metrics-'
+
+
+def empty_histogram(metric):
+    return {'count': 0, 'sum': 0, 'max': 0,
+            'buckets': [0] * (len(BUCKETS[metric]) + 1)}
+
+
+def add_to_histogram(histogram, metric, value):
+    histogram['count'] += 1
+    histogram['sum'] += value
+    histogram['max'] = max(histogram['max'], value)
+    for index, bound in enumerate(BUCKETS[metric]):
+        if value <= bound:
+            break
+    else:
+        index = len(BUCKETS[metric])
+    histogram['buckets'][index] += 1
+
+
+def merge_histograms(target, source):
+    target['count'] += source['count']
+    target['sum'] += source['sum']
+    target['max'] = max(target['max'], source['max'])
+    target['buckets'] = [left + right for left, right
+                         in zip(target['buckets'], source['buckets'])]
+
+
+def percentile(histogram, metric, fraction):
+    """
+    Оценка перцентиля по гистограмме: верхняя граница корзины.
+    """
+    if not histogram['count']:
+        return 0
+    threshold = histogram['count'] * fraction
+    seen = 0
+    for index, count in enumerate(histogram['buckets']):
+        seen += count
+        if seen >= threshold:
+            if index < len(BUCKETS[metric]):
+                return BUCKETS[metric][index]
+            return histogram['max']
+    return histogram['max']
+
+
+class EndpointMetrics:
+    """
+    Гистограммы метрик запросов по эндпоинтам в памяти процесса.
+
+    Снимок периодически сбрасывается в файл каталога API_METRICS_DIR,
+    чтобы команда api_metrics могла собрать данные всех процессов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, endpoint, values):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {})
+            for metric, value in values.items():
+                histogram = stats.setdefault(metric, empty_histogram(metric))
+                add_to_histogram(histogram, metric, value)
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    def flush_if_due(self, directory, interval):
+        if time.monotonic() - self._last_flush < interval:
+            return
+        self.flush(directory)
+
+    def flush(self, directory):
+        self._last_flush = time.monotonic()
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{SNAPSHOT_PREFIX}{os.getpid()}.json'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self.snapshot()))
+        temporary.replace(path)
+
+    @staticmethod
+    def load(directory):
+        """
+        Объединяет снимки всех процессов из каталога.
+        """
+        merged = {}
+        for path in Path(directory).glob(f'{SNAPSHOT_PREFIX}*.json'):
+            for endpoint, stats in json.loads(path.read_text()).items():
+                target = merged.setdefault(endpoint, {})
+                for metric, histogram in stats.items():
+                    merge_histograms(
+                        target.setdefault(metric, empty_histogram(metric)),
+                        histogram)
+        return merged
+
+    @staticmethod
+    def reset(directory):
+        for path in Path(directory).glob(f'{SNAPSHOT_PREFIX}*.json'):
+            path.unlink()
+
+
+endpoint_metrics = EndpointMetrics()
@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+from .db_router import replica_reads
+from .metrics import endpoint_metrics
+
+PRIMARY_PIN_KEY_PREFIX = 'primary_pin'
+
+# Счетчик SQL-запросов текущего HTTP-запроса. asgiref переносит
+# контекст в потоки sync_to_async, поэтому учитываются и запросы
+# представлений, выполняемых в пуле потоков под ASGI
+current_query_counter = ContextVar('current_query_counter', default=None)
+
+
+class QueryCounter:
+    """Обертка выполнения SQL, считающая запросы и время в БД."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def count_current_queries(execute, sql, params, many, context):
+    """
+    Обертка выполнения SQL для всех соединений: передает запрос
+    счетчику текущего HTTP-запроса, если он есть.
+    """
+    counter = current_query_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    Подключает count_current_queries к новому соединению любого
+    потока (обработчик сигнала connection_created).
+    """
+    if count_current_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_current_queries)
+
+
+@contextmanager
+def measure_serialization(request):
+    """
+    Добавляет время блока к request.metrics_serialize, если запрос
+    обрабатывается QueryMetricsMiddleware. Время SQL-запросов блока
+    учитывается отдельно, в db.
+    """
+    request = getattr(request, '_request', request)
+    counter = current_query_counter.get()
+    if counter is None or not hasattr(request, 'metrics_serialize'):
+        yield
+        return
+    db_start = counter.duration
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        request.metrics_serialize += max(
+            elapsed - (counter.duration - db_start), 0)
+
+
+def get_endpoint_name(request, view_func):
+    """
+    Имя эндпоинта: ViewSet.action для DRF, модуль.функция для остальных.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class HybridMiddleware:
+    """
+    Основа middleware, работающих и под WSGI, и под ASGI без
+    переключения в единственный поток синхронного кода.
+    Наследники реализуют __call__ для WSGI и __acall__ для ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Как в MiddlewareMixin: обработчик Django должен
+            # распознать экземпляр как корутинную функцию
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+class QueryMetricsMiddleware(HybridMiddleware):
+    """
+    Собирает по каждому эндпоинту число SQL-запросов, время в БД,
+    время представления, сериализации и отрисовки ответа, размер
+    ответа.
+
+    Метрики отдаются в заголовке Server-Timing и копятся
+    в гистограммах (api.metrics), см. команду api_metrics.
+    Запросы, выполняемые при отдаче StreamingHttpResponse,
+    происходят после middleware и не учитываются.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if self.is_async:
+            # Синхронный обработчик Django под ASGI выполнял бы
+            # в потоке синхронного кода
+            self.process_template_response = (
+                self.aprocess_template_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter, start = self.start(request)
+        token = current_query_counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_query_counter.reset(token)
+        values = self.finish(request, response, counter, start)
+        if values is not None:
+            endpoint_metrics.flush_if_due(
+                settings.API_METRICS_DIR,
+                settings.API_METRICS_FLUSH_INTERVAL)
+        return response
+
+    async def __acall__(self, request):
+        counter, start = self.start(request)
+        token = current_query_counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_query_counter.reset(token)
+        values = self.finish(request, response, counter, start)
+        if values is not None:
+            await sync_to_async(endpoint_metrics.flush_if_due,
+                                thread_sensitive=False)(
+                settings.API_METRICS_DIR,
+                settings.API_METRICS_FLUSH_INTERVAL)
+        return response
+
+    @staticmethod
+    def start(request):
+        request.metrics_render = None
+        request.metrics_serialize = 0.0
+        return QueryCounter(), time.perf_counter()
+
+    @staticmethod
+    def finish(request, response, counter, start):
+        """
+        Записывает метрики запроса и заголовок Server-Timing.
+        Возвращает метрики или None для запросов вне представлений.
+        """
+        total = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return None
+        render_start, render_end = request.metrics_render or (0, 0)
+        render = render_end - render_start
+        serialize = request.metrics_serialize
+        view = max(total - render - serialize - counter.duration, 0)
+        values = {
+            'total_ms': total * 1000,
+            'db_ms': counter.duration * 1000,
+            'view_ms': view * 1000,
+            'serialize_ms': serialize * 1000,
+            'render_ms': render * 1000,
+            'queries': counter.count,
+        }
+        if not response.streaming:
+            values['size_bytes'] = len(response.content)
+        endpoint_metrics.record(get_endpoint_name(request, match.func),
+                                values)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={values["db_ms"]:.1f};desc="{counter.count} queries"',
+            f'view;dur={values["view_ms"]:.1f}',
+            f'serialize;dur={values["serialize_ms"]:.1f}',
+            f'render;dur={values["render_ms"]:.1f}',
+            f'total;dur={values["total_ms"]:.1f}',
+        ))
+        return values
+
+    def process_template_response(self, request, response):
+        return self.track_render(request, response)
+
+    async def aprocess_template_response(self, request, response):
+        return self.track_render(request, response)
+
+    @staticmethod
+    def track_render(request, response):
+        """Запоминает время отрисовки отложенного ответа."""
+        # Ответ, отрисованный в пуле потоков (api.async_views),
+        # уже содержит время отрисовки
+        if response.is_rendered:
+            return response
+        render_start = time.perf_counter()
+
+        def finish_render(rendered):
+            request.metrics_render = (render_start, time.perf_counter())
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """
+    Разрешает чтение из реплик для безопасных запросов, если клиент
+    не выполнял запись последние REPLICA_STICKY_SECONDS. Клиент
+    определяется по заголовку Authorization, сессии или IP-адресу
+    (за nginx — из заголовка CLIENT_IP_HEADER), потому что
+    аутентификация DRF происходит позже, во view.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        pin_key = self.get_pin_key(request)
+        safe = request.method in SAFE_METHODS
+        token = replica_reads.set(safe and not cache.get(pin_key))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        if not safe:
+            cache.set(pin_key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        pin_key = self.get_pin_key(request)
+        safe = request.method in SAFE_METHODS
+        pinned = safe and await sync_to_async(
+            cache.get, thread_sensitive=False)(pin_key)
+        token = replica_reads.set(safe and not pinned)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        if not safe:
+            await sync_to_async(cache.set, thread_sensitive=False)(
+                pin_key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    @staticmethod
+    def get_pin_key(request):
+        client = (request.META.get('HTTP_AUTHORIZATION')
+                  or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+                  or request.META.get(settings.CLIENT_IP_HEADER)
+                  or request.META.get('REMOTE_ADDR', ''))
+        digest = hashlib.md5(client.encode()).hexdigest()
+        return f'{PRIMARY_PIN_KEY_PREFIX}:{digest}'
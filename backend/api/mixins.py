@@ -1,4 +1,12 @@
+import math
+from contextlib import nullcontext
+
+from django.db.models import Count, OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
 
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -11,43 +19,151 @@ from recipes.models import (Favorite,
 from users.models import Subscription, User
 from .serializers import (BriefRecipeSerializer,
                           ChangePasswordSerializer,
+                          RecipeBatchSerializer,
                           RecipeFollowSerializer,
                           UserFollowSerializer
                           )
+from .constants import ANONYMOUS_CACHE_MAX_AGE
+from .db_router import primary_reads, replica_may_lag
+from .pagination import SubscriptionPagination
+from .recipe_service import RecipeService
 from .utils import recipe_add_or_del
+from .links import insert_link, parse_id
+from .middleware import measure_serialization
+from .versions import (bump_version,
+                       get_versions,
+                       make_etag,
+                       user_state_key,
+                       version_key)
+
+
+class SerializationMetricsMixin:
+    """
+    Миксин замера времени сериализации: list и retrieve работают
+    как в DRF, но обращение к serializer.data замеряется явно
+    и попадает в метрики запроса отдельно от времени view.
+    """
+
+    def get_serialized_data(self, serializer):
+        with measure_serialization(self.request):
+            return serializer.data
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serialized_data(
+                self.get_serializer(page, many=True)))
+        return Response(self.get_serialized_data(
+            self.get_serializer(queryset, many=True)))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_serialized_data(
+            self.get_serializer(self.get_object())))
+
+
+class ConditionalGetMixin:
+    """
+    Миксин условных GET-запросов: ETag и Last-Modified по версиям данных,
+    ответ 304 без сериализации и Cache-Control для анонимных запросов.
+    """
+    version_models = ()
+    conditional_actions = ('list', 'retrieve')
+    user_dependent = False
+
+    def get_version_keys(self):
+        """
+        Ключи версий данных, от которых зависит ответ.
+        """
+        keys = [version_key(model) for model in self.version_models]
+        if self.user_dependent and self.request.user.is_authenticated:
+            keys.append(user_state_key(self.request.user.pk))
+        return keys
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        """
+        Возвращает 304, если данные не менялись, иначе ответ handler
+        с заголовками ETag, Last-Modified и Cache-Control.
+        """
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+        versions = get_versions(*self.get_version_keys())
+        etag = quote_etag(make_etag(
+            request.get_full_path(),
+            request.accepted_media_type,
+            request.user.pk if self.user_dependent else None,
+            *versions
+        ))
+        # Версии дробные, а Last-Modified точен до секунды: две записи
+        # в одну секунду дали бы одинаковую дату. Поэтому 304 решается
+        # только по ETag, а дата округляется вверх и лишь сообщается
+        last_modified = math.ceil(max(versions)) if versions else None
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            # Ответ из отстающей реплики ушел бы под ETag новой версии
+            reads = (primary_reads()
+                     if versions and replica_may_lag(*versions)
+                     else nullcontext())
+            with reads:
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True,
+                                max_age=ANONYMOUS_CACHE_MAX_AGE)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list,
+                                         request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve,
+                                         request, *args, **kwargs)
 
 
 class BaseRecipeMixin:
     """
     Миксин для работы с рецептами.
     """
-    def get_recipe(self, pk):
+    def change_batch(self, request, model):
         """
-        Получить рецепт по его ID.
+        Добавить (POST) или удалить (DELETE) несколько рецептов
+        из модели связей. Результат возвращается для каждого рецепта.
         """
-        return get_object_or_404(Recipe, id=pk)
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            results = RecipeService.add_many(request.user, recipe_ids, model)
+        else:
+            results = RecipeService.remove_many(request.user, recipe_ids,
+                                                model)
+        return Response({'results': [
+            {'id': recipe_id, 'status': result}
+            for recipe_id, result in results.items()]})
 
     def add_to_favorites(self, request, pk):
         """
         Добавить рецепт в избранное.
         """
-        recipe = self.get_recipe(pk)
-        Favorite.objects.create(user=request.user, recipe=recipe)
-        return Response({'detail': 'Рецепт добавлен в избранное'})
+        return self._change_link(request, pk, Favorite,
+                                 'Рецепт добавлен в избранное',
+                                 'Рецепт уже в избранном')
 
     def _remove_from_favorites(self, request, pk):
         """
         Удалить рецепт из избранного.
         """
-        recipe = self.get_recipe(pk)
-        favorite = Favorite.objects.filter(user=request.user,
-                                           recipe=recipe).first()
-        if favorite:
-            favorite.delete()
-            return Response({'detail': 'Рецепт удален из избранного'})
-        else:
-            return Response({'detail': 'Рецепт не найден в избранном'},
-                            status=status.HTTP_404_NOT_FOUND)
+        return self._change_link(request, pk, Favorite,
+                                 'Рецепт удален из избранного',
+                                 'Рецепт не найден в избранном')
 
     def favorite_recipe(self, request, pk):
         """
@@ -62,23 +178,33 @@ class BaseRecipeMixin:
         """
         Добавить рецепт в корзину.
         """
-        recipe = self.get_recipe(pk)
-        ShoppingCart.objects.create(user=request.user, recipe=recipe)
-        return Response({'detail': 'Рецепт добавлен в корзину'})
+        return self._change_link(request, pk, ShoppingCart,
+                                 'Рецепт добавлен в корзину',
+                                 'Рецепт уже в корзине')
 
     def _remove_from_shopping_cart(self, request, pk):
         """
         Удалить рецепт из корзины.
         """
-        recipe = self.get_recipe(pk)
-        shopping_cart = ShoppingCart.objects.filter(user=request.user,
-                                                    recipe=recipe).first()
-        if shopping_cart:
-            shopping_cart.delete()
-            return Response({'detail': 'Рецепт удален из корзины'})
-        else:
-            return Response({'detail': 'Рецепт не найден в корзине'},
-                            status=status.HTTP_404_NOT_FOUND)
+        return self._change_link(request, pk, ShoppingCart,
+                                 'Рецепт удален из корзины',
+                                 'Рецепт не найден в корзине')
+
+    @staticmethod
+    def _change_link(request, pk, model, done_message, skipped_message):
+        """
+        Добавить (POST) или удалить рецепт из модели связей одной
+        командой. Повторный запрос не приводит к ошибке сервера.
+        """
+        if request.method == 'POST':
+            if RecipeService.add(request.user, pk, model):
+                return Response({'detail': done_message})
+            return Response({'detail': skipped_message},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if RecipeService.remove(request.user, pk, model):
+            return Response({'detail': done_message})
+        return Response({'detail': skipped_message},
+                        status=status.HTTP_404_NOT_FOUND)
 
 
 class SubscriptionsMixin:
@@ -86,17 +212,42 @@ class SubscriptionsMixin:
     Миксин для работы с подписками: получение подписок пользователя.
     """
     @action(detail=False, methods=['get'],
-            permission_classes=(permissions.IsAuthenticated,))
+            permission_classes=(permissions.IsAuthenticated,),
+            pagination_class=SubscriptionPagination)
     def subscriptions(self, request):
         """
         Получить список подписок пользователя.
         """
-        queryset = User.objects.filter(subscriber__user=self.request.user)
+        queryset = User.objects.filter(
+            subscriber__user=self.request.user
+        ).annotate(
+            recipes_count=Count('recipes')
+        ).order_by('username').prefetch_related(
+            self._get_recipes_prefetch(request))
         pages = self.paginate_queryset(queryset)
         serializer = RecipeFollowSerializer(pages,
                                             many=True,
                                             context={'request': request})
-        return self.get_paginated_response(serializer.data)
+        with measure_serialization(request):
+            data = serializer.data
+        return self.get_paginated_response(data)
+
+    @staticmethod
+    def _get_recipes_prefetch(request):
+        """
+        Подгружает не более recipes_limit последних рецептов
+        каждого автора одним запросом.
+        """
+        recipes = Recipe.objects.all()
+        limit = request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('-pub_date').values('pk')[:int(limit)]
+            ))
+        return Prefetch('recipes', queryset=recipes,
+                        to_attr='limited_recipes')
 
 
 class SubscribeMixin:
@@ -109,20 +260,28 @@ class SubscribeMixin:
         """
         Подписаться или отписаться от автора.
         """
-        author = get_object_or_404(User, id=kwargs['id'])
+        author_id = parse_id(kwargs['id'])
 
         if request.method == 'POST':
-            serializer = UserFollowSerializer(author,
-                                              data=request.data,
+            if author_id == request.user.pk:
+                return Response({'detail': 'Нельзя подписаться на себя'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not insert_link(Subscription, request.user.pk,
+                               'author', author_id):
+                get_object_or_404(User, id=author_id)
+                return Response({'detail': 'Вы уже подписаны на автора'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            bump_version(user_state_key(request.user.pk))
+            serializer = UserFollowSerializer(User.objects.get(id=author_id),
                                               context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            Subscription.objects.create(user=request.user,
-                                        author=author)
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
-        get_object_or_404(Subscription,
-                          user=request.user,
-                          author=author).delete()
+        deleted, _ = Subscription.objects.filter(user=request.user,
+                                                 author_id=author_id).delete()
+        if not deleted:
+            return Response({'detail': 'Вы не подписаны на автора'},
+                            status=status.HTTP_404_NOT_FOUND)
+        bump_version(user_state_key(request.user.pk))
         return Response({'detail': 'Вы отписались от автора'},
                         status=status.HTTP_204_NO_CONTENT)
 
@@ -158,6 +317,16 @@ class FavoriteRecipeMixin(BaseRecipeMixin):
         elif request.method == 'DELETE':
             return self._remove_from_favorites(request, pk)
 
+    @action(detail=False, methods=['POST', 'DELETE'],
+            url_path='favorite',
+            permission_classes=(permissions.IsAuthenticated,))
+    def favorite_batch(self, request):
+        """
+        Добавить или удалить несколько рецептов из избранного:
+        {"recipes": [id, ...]}.
+        """
+        return self.change_batch(request, Favorite)
+
 
 class ShoppingCartMixin(BaseRecipeMixin):
     """
@@ -174,3 +343,13 @@ class ShoppingCartMixin(BaseRecipeMixin):
             return self._add_to_shopping_cart(request, pk)
         elif request.method == 'DELETE':
             return self._remove_from_shopping_cart(request, pk)
+
+    @action(detail=False, methods=['POST', 'DELETE'],
+            url_path='shopping_cart',
+            permission_classes=(permissions.IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        """
+        Добавить или удалить несколько рецептов из корзины покупок:
+        {"recipes": [id, ...]}.
+        """
+        return self.change_batch(request, ShoppingCart)
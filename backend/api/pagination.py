@@ -1,7 +1,73 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import (BasePagination,
+                                       CursorPagination,
+                                       PageNumberPagination)
 
 from .constants import PAGE_LIMIT
 
 
 class CustomPagination(PageNumberPagination):
     page_size = PAGE_LIMIT
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация ленты рецептов по (pub_date, id)."""
+    page_size = PAGE_LIMIT
+    ordering = ('-pub_date', '-id')
+
+
+class SubscriptionCursorPagination(CursorPagination):
+    """Курсорная пагинация подписок по имени пользователя."""
+    page_size = PAGE_LIMIT
+    ordering = ('username',)
+
+
+class OptInCursorPagination(BasePagination):
+    """
+    Постраничная пагинация по умолчанию и курсорная по запросу:
+    ?pagination=cursor для первой страницы, далее ссылки next/previous
+    с параметром cursor. Курсорный режим не выполняет COUNT(*) и OFFSET.
+    Курсор работает только с фиксированной сортировкой cursor_class,
+    поэтому вместе с параметром ordering возвращается ошибка 400.
+    """
+    page_number_class = CustomPagination
+    cursor_class = RecipeCursorPagination
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+    ordering_query_param = 'ordering'
+
+    def __init__(self):
+        self.paginator = self.page_number_class()
+
+    def is_cursor_mode(self, request):
+        return (request.query_params.get(self.mode_query_param)
+                == self.cursor_mode
+                or self.cursor_class.cursor_query_param
+                in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_mode(request):
+            if request.query_params.get(self.ordering_query_param):
+                raise ValidationError({self.ordering_query_param: [
+                    'Курсорная пагинация не поддерживает другую '
+                    'сортировку, используйте постраничную.']})
+            self.paginator = self.cursor_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        return self.paginator.display_page_controls
+
+
+class SubscriptionPagination(OptInCursorPagination):
+    """Пагинация подписок с курсорным режимом по запросу."""
+    cursor_class = SubscriptionCursorPagination
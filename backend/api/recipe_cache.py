@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+from .db_router import replica_may_lag
+from .versions import get_versions, make_etag, version_key
+
+RECIPE_CACHE_KEY_PREFIX = 'recipe_payload'
+
+
+class RecipePayloadCache:
+    """
+    Кэш общей для всех пользователей части сериализованного рецепта.
+
+    Ключ включает версии рецепта, его автора и справочников тегов
+    и ингредиентов (см. api.versions), поэтому при их изменении
+    старые записи просто перестают читаться и вытесняются по таймауту.
+    Рецепты, изменившиеся недавно, не кэшируются, пока запрос читает
+    из реплики: она может отдать состояние до изменения.
+    """
+
+    @property
+    def cache(self):
+        return caches[settings.RECIPE_CACHE_ALIAS]
+
+    @staticmethod
+    def get_keys(recipes, request=None):
+        """
+        Ключи кэша для рецептов: {recipe.pk: key}. Рецептов, которые
+        могли еще не дойти до реплики (см. replica_may_lag), в ответе
+        нет: они сериализуются без кэша.
+        """
+        recipes = list(recipes)
+        shared = (version_key(Tag), version_key(Ingredient))
+        version_keys = list(shared)
+        for recipe in recipes:
+            version_keys.append(version_key(Recipe, recipe.pk))
+            version_keys.append(version_key(User, recipe.author_id))
+        versions = get_versions(*version_keys)
+        shared_versions = versions[:len(shared)]
+        recipe_versions = versions[len(shared):]
+        host = request.build_absolute_uri('/') if request else None
+        keys = {}
+        for index, recipe in enumerate(recipes):
+            versions = (*shared_versions,
+                        *recipe_versions[index * 2:index * 2 + 2])
+            if replica_may_lag(*versions):
+                continue
+            keys[recipe.pk] = (f'{RECIPE_CACHE_KEY_PREFIX}:{recipe.pk}:'
+                               + make_etag(host, *versions))
+        return keys
+
+    def get_many(self, keys):
+        """
+        Читает закэшированные рецепты: {recipe.pk: payload}.
+        """
+        found = self.cache.get_many(list(keys.values()))
+        return {pk: found[key] for pk, key in keys.items() if key in found}
+
+    def set_many(self, keys, payloads):
+        """
+        Сохраняет рецепты {recipe.pk: payload} под их ключами,
+        рецепты без ключа не сохраняются.
+        """
+        self.cache.set_many(
+            {keys[pk]: payload for pk, payload in payloads.items()
+             if pk in keys},
+            settings.RECIPE_CACHE_TIMEOUT)
+
+
+recipe_payload_cache = RecipePayloadCache()
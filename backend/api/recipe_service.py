@@ -1,25 +1,130 @@
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 from django.shortcuts import get_object_or_404
 
+from recipes.models import Favorite, Recipe, ShoppingCart
+from .links import delete_links, insert_link, insert_links, parse_id
+from .shopping_list_service import ShoppingListService
+from .versions import bump_version, recipe_counters_key, user_state_key
+
 
 class RecipeService:
     """
     Сервис для добавления и удаления объектов из модели связей с рецептом.
     """
-    @staticmethod
-    def add(request, recipe, model):
+    counter_fields = {
+        Favorite: 'favorites_count',
+        ShoppingCart: 'shopping_carts_count',
+    }
+
+    @classmethod
+    def add(cls, user, recipe_id, model):
         """
-        Добавление объекта в модель связей с рецептом.
+        Добавление рецепта в модель связей одной командой INSERT
+        без предварительного чтения. Возвращает True, если связь
+        создана, и False, если она уже была.
         """
-        obj, created = model.objects.get_or_create(
-            user=request.user,
-            recipe=recipe
-        )
+        recipe_id = parse_id(recipe_id)
+        with transaction.atomic():
+            created = insert_link(model, user.pk, 'recipe', recipe_id)
+            if created:
+                cls.on_added(user, [recipe_id], model)
+        if not created:
+            get_object_or_404(Recipe, pk=recipe_id)
         return created
 
+    @classmethod
+    def remove(cls, user, recipe_id, model):
+        """
+        Удаление рецепта из модели связей одной командой DELETE.
+        Возвращает True, если связь была удалена.
+        """
+        recipe_id = parse_id(recipe_id)
+        with transaction.atomic():
+            # Без сборщика удаления Django: он выполнил бы SELECT
+            # и обработчики сигналов (api.signals)
+            deleted = delete_links(model, user.pk, 'recipe', [recipe_id])
+            if deleted:
+                cls.on_removed(user, [recipe_id], model)
+        if not deleted:
+            get_object_or_404(Recipe, pk=recipe_id)
+        return bool(deleted)
+
+    @classmethod
+    def add_many(cls, user, recipe_ids, model):
+        """
+        Пакетное добавление рецептов в модель связей.
+        Счетчики и список покупок меняются только для строк,
+        действительно вставленных этим запросом.
+        Возвращает {recipe_id: added | exists | not_found}.
+        """
+        with transaction.atomic():
+            added = insert_links(model, user.pk, 'recipe', recipe_ids)
+            if added:
+                cls.on_added(user, sorted(added), model)
+        existing = cls.get_existing_ids(recipe_ids)
+        return {pk: ('added' if pk in added
+                     else 'exists' if pk in existing else 'not_found')
+                for pk in recipe_ids}
+
+    @classmethod
+    def remove_many(cls, user, recipe_ids, model):
+        """
+        Пакетное удаление рецептов из модели связей.
+        Счетчики и список покупок меняются только для строк,
+        действительно удаленных этим запросом.
+        Возвращает {recipe_id: removed | absent | not_found}.
+        """
+        with transaction.atomic():
+            removed = delete_links(model, user.pk, 'recipe', recipe_ids)
+            if removed:
+                cls.on_removed(user, sorted(removed), model)
+        existing = cls.get_existing_ids(recipe_ids)
+        return {pk: ('removed' if pk in removed
+                     else 'absent' if pk in existing else 'not_found')
+                for pk in recipe_ids}
+
     @staticmethod
-    def remove(request, recipe, model):
+    def get_existing_ids(recipe_ids):
+        """Id существующих рецептов из списка."""
+        return set(Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', flat=True))
+
+    @classmethod
+    def on_added(cls, user, recipe_ids, model):
+        """
+        Обновляет счетчики, список покупок и версию связей пользователя
+        после добавления рецептов. Вставки в обход save()
+        не отправляют сигналы, поэтому версия меняется здесь.
+        """
+        cls.change_counters(recipe_ids, model, 1)
+        if model is ShoppingCart:
+            ShoppingListService.add_recipes(user, recipe_ids)
+        bump_version(user_state_key(user.pk))
+
+    @classmethod
+    def on_removed(cls, user, recipe_ids, model):
+        """
+        Обновляет счетчики, список покупок и версию связей пользователя
+        после удаления рецептов.
+        """
+        cls.change_counters(recipe_ids, model, -1)
+        if model is ShoppingCart:
+            ShoppingListService.remove_recipes(user, recipe_ids)
+        bump_version(user_state_key(user.pk))
+
+    @classmethod
+    def change_counters(cls, recipe_ids, model, delta):
         """
-        Удаление объекта из модели связей с рецептом.
+        Изменяет счетчики нескольких рецептов одним запросом.
+        Счетчики не кэшируются вместе с рецептом, поэтому меняется
+        только версия счетчиков, а не версия рецепта.
         """
-        obj = get_object_or_404(model, user=request.user, recipe=recipe)
-        obj.delete()
+        field = cls.counter_fields.get(model)
+        if field is None:
+            return
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            **{field: Greatest(F(field) + delta, Value(0))})
+        for recipe_id in recipe_ids:
+            bump_version(recipe_counters_key(recipe_id))
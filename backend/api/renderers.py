@@ -0,0 +1,147 @@
+import csv
+import io
+import os
+from abc import ABCMeta, abstractmethod
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+from .constants import (NUMBERING,
+                        PDF_FONT_SIZE,
+                        PDF_LINE_HEIGHT,
+                        PDF_MARGIN)
+
+SHOPPING_LIST_TITLE = 'Что купить:'
+
+
+class _Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer, metaclass=ABCMeta):
+    """
+    Базовый потоковый рендерер списка покупок.
+
+    Строки списка — кортежи (название, единица измерения, количество).
+    Метод stream отдает файл частями, не собирая его целиком в памяти.
+    """
+    charset = 'utf-8'
+    filename = 'shopping-list'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Отрисовывает обычный ответ DRF (например, сообщение об ошибке).
+        """
+        if isinstance(data, dict):
+            return '\n'.join(str(value) for value in data.values())
+        return str(data or '')
+
+    @abstractmethod
+    def stream(self, rows):
+        """
+        Возвращает генератор частей файла со списком покупок.
+        """
+
+    @property
+    def content_type(self):
+        """
+        Заголовок Content-Type для потокового ответа.
+        """
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    @property
+    def content_disposition(self):
+        """
+        Заголовок Content-Disposition для скачивания файла.
+        """
+        return f'attachment; filename="{self.filename}.{self.format}"'
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    """Список покупок в виде нумерованного текста."""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        yield SHOPPING_LIST_TITLE
+        for counter, (name, measure, amount) in enumerate(rows, NUMBERING):
+            yield f'\n{counter}. {name} - {amount} {measure},'
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    """Список покупок в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Единица измерения', 'Количество')
+
+    def stream(self, rows):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(self.header)
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """
+    Список покупок в формате PDF.
+
+    Формат PDF требует таблицу ссылок в конце файла, поэтому документ
+    отдается одним блоком после обхода строк, но строки по-прежнему
+    читаются из курсора порциями.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+
+    def get_font_name(self):
+        """
+        Регистрирует шрифт с кириллицей SHOPPING_LIST_PDF_FONT.
+        Стандартные шрифты PDF кириллицу не отображают, поэтому
+        без него список не формируется.
+        """
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        font_path = settings.SHOPPING_LIST_PDF_FONT
+        if not font_path or not os.path.exists(font_path):
+            raise ImproperlyConfigured(
+                f'Шрифт для списка покупок в PDF не найден: {font_path}. '
+                'Укажите TTF-шрифт с кириллицей в SHOPPING_LIST_PDF_FONT.')
+        pdfmetrics.registerFont(TTFont(self.font_name, font_path))
+        return self.font_name
+
+    def stream(self, rows):
+        # Шрифт проверяется до начала ответа, а не при отдаче файла
+        return self.stream_pdf(rows, self.get_font_name())
+
+    @staticmethod
+    def stream_pdf(rows, font_name):
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        top = A4[1] - PDF_MARGIN
+        y_position = top
+
+        def write_line(text):
+            nonlocal y_position
+            if y_position < PDF_MARGIN:
+                pdf.showPage()
+                y_position = top
+            pdf.setFont(font_name, PDF_FONT_SIZE)
+            pdf.drawString(PDF_MARGIN, y_position, text)
+            y_position -= PDF_LINE_HEIGHT
+
+        write_line(SHOPPING_LIST_TITLE)
+        for counter, (name, measure, amount) in enumerate(rows, NUMBERING):
+            write_line(f'{counter}. {name} - {amount} {measure}')
+        pdf.save()
+        yield buffer.getvalue()
@@ -1,4 +1,5 @@
 from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
 from rest_framework import serializers
 
 from djoser.serializers import UserCreateSerializer, UserSerializer
@@ -7,14 +8,21 @@ from recipes.models import (Favorite,
                             Ingredient,
                             Recipe,
                             RecipeIngredientAmount,
+                            RecipeQuerySet,
                             ShoppingCart,
                             Tag)
 from users.models import User
+from .constants import RECIPE_BATCH_LIMIT
 from .fields import Base64ImageField
+from .image_service import ImageVariantService
+from .recipe_cache import recipe_payload_cache
+from .shopping_list_service import ShoppingListService
 from .utils import is_user_subscribed
+from .versions import bump_version, version_key
 from .validators import (validate_username_format,
                          validate_cooking_duration,
                          validate_ingredient_amount,
+                         validate_ingredient_ids,
                          validate_updated_password)
 
 
@@ -94,6 +102,16 @@ class UsersSerializer(SubscribedMixin, UserSerializer):
                   'is_subscribed')
 
 
+class RecipeAuthorSerializer(UsersSerializer):
+    """
+    Сериализатор автора в составе рецепта без признака подписки:
+    он зависит от пользователя и добавляется после чтения из кэша.
+    """
+
+    class Meta(UsersSerializer.Meta):
+        fields = ('id', 'email', 'username', 'first_name', 'last_name')
+
+
 class CreateUserSerializer(SubscribedMixin, UserCreateSerializer):
     """
     Сериализатор для создания пользователей.
@@ -107,15 +125,30 @@ class CreateUserSerializer(SubscribedMixin, UserCreateSerializer):
                   'last_name', 'password', 'id')
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """
+    Списковый сериализатор рецептов, читающий их из кэша одним запросом.
+    """
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representation_many(list(recipes))
+
+
 class FullRecipeSerializer(serializers.ModelSerializer):
     """
     Сериализатор для рецептов.
+
+    Общая для всех пользователей часть ответа берется из кэша
+    (api.recipe_cache), признаки текущего пользователя и счетчики,
+    которые меняются при каждом добавлении в избранное и корзину,
+    добавляются после чтения из строки рецепта.
     """
-    author = UsersSerializer(read_only=True)
+    author = RecipeAuthorSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(many=True,
                                              source='recipes')
     tags = TagSerializer(many=True)
-    image = Base64ImageField()
+    image = Base64ImageField(variant='medium')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -123,6 +156,8 @@ class FullRecipeSerializer(serializers.ModelSerializer):
         """
         Возвращает, добавлен ли рецепт в избранное у текущего пользователя.
         """
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return (self.context.get('request')
                 and not self.context.get('request').user.is_anonymous
                 and self.context.get('request').user.favorites.filter(
@@ -133,6 +168,8 @@ class FullRecipeSerializer(serializers.ModelSerializer):
         Возвращает, добавлен ли рецепт в корзину покупок
         текущего пользователя.
         """
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return (self.context.get('request')
                 and not self.context.get('request').user.is_anonymous
                 and self.context.get('request').user.shopping_carts.filter(
@@ -142,7 +179,59 @@ class FullRecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'name', 'image', 'text',
                   'ingredients', 'cooking_time',
-                  'is_favorited', 'is_in_shopping_cart')
+                  'is_favorited', 'is_in_shopping_cart',
+                  'favorites_count', 'shopping_carts_count')
+        read_only_fields = ('favorites_count', 'shopping_carts_count')
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes):
+        """
+        Сериализует рецепты, отрисовывая заново только
+        отсутствующие в кэше.
+        """
+        request = self.context.get('request')
+        keys = recipe_payload_cache.get_keys(recipes, request)
+        payloads = recipe_payload_cache.get_many(keys)
+        missing = [recipe for recipe in recipes if recipe.pk not in payloads]
+        if missing:
+            prefetch_related_objects(missing, 'author',
+                                     *RecipeQuerySet.related_lookups())
+            rendered = {recipe.pk: self.to_shared_representation(recipe)
+                        for recipe in missing}
+            recipe_payload_cache.set_many(keys, rendered)
+            payloads.update(rendered)
+        return [self.add_user_fields(payloads[recipe.pk], recipe)
+                for recipe in recipes]
+
+    def to_shared_representation(self, instance):
+        """
+        Представление рецепта без подписки на автора. Признаки
+        is_favorited и is_in_shopping_cart и счетчики остаются
+        на своих местах и всегда перезаписываются в add_user_fields.
+        """
+        return super().to_representation(instance)
+
+    def add_user_fields(self, data, instance):
+        """
+        Добавляет к общему представлению признаки текущего пользователя
+        и счетчики рецепта.
+        """
+        return {
+            **data,
+            'author': {
+                **data['author'],
+                'is_subscribed': is_user_subscribed(
+                    request=self.context.get('request'),
+                    obj=instance.author)
+            },
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+            'favorites_count': instance.favorites_count,
+            'shopping_carts_count': instance.shopping_carts_count,
+        }
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -159,30 +248,56 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         """
         validated_attrs = super().validate(attrs)
         validate_ingredient_amount(validated_attrs.get('ingredients'))
+        validate_ingredient_ids(validated_attrs.get('ingredients'))
         validate_cooking_duration(validated_attrs.get('cooking_time'))
         return validated_attrs
 
     class Meta:
         model = Recipe
         fields = '__all__'
+        read_only_fields = ('favorites_count', 'shopping_carts_count',
+                            'image_variants')
 
     @staticmethod
     def save_ingredients(recipe, ingredient_data_list):
         """
         Сохраняет связи между рецептом и ингредиентами с их количеством.
+        Применяется только разница с текущим составом: изменившиеся
+        количества обновляются, новые связи создаются, лишние удаляются.
         """
-        recipe_ingredient_amounts = [
-            RecipeIngredientAmount(
-                recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient['amount']
-            )
-            for ingredient in ingredient_data_list
-        ]
-        with transaction.atomic():
-            RecipeIngredientAmount.objects.filter(recipe=recipe).delete()
+        new_amounts = {ingredient['id']: ingredient['amount']
+                       for ingredient in ingredient_data_list}
+        with transaction.atomic(), ShoppingListService.applying_deltas():
+            current = {
+                item.ingredient_id: item
+                for item in RecipeIngredientAmount.objects
+                .select_for_update().filter(recipe=recipe)}
+            old_amounts = {ingredient_id: item.amount
+                           for ingredient_id, item in current.items()}
+            if new_amounts == old_amounts:
+                return
+            removed_ids = old_amounts.keys() - new_amounts.keys()
+            if removed_ids:
+                RecipeIngredientAmount.objects.filter(
+                    recipe=recipe, ingredient_id__in=removed_ids).delete()
+            changed = []
+            for ingredient_id, item in current.items():
+                amount = new_amounts.get(ingredient_id, item.amount)
+                if amount != item.amount:
+                    item.amount = amount
+                    changed.append(item)
+            if changed:
+                RecipeIngredientAmount.objects.bulk_update(changed,
+                                                           ['amount'])
             RecipeIngredientAmount.objects.bulk_create(
-                recipe_ingredient_amounts)
+                RecipeIngredientAmount(recipe=recipe,
+                                       ingredient_id=ingredient_id,
+                                       amount=amount)
+                for ingredient_id, amount in new_amounts.items()
+                if ingredient_id not in current)
+            ShoppingListService.change_recipe(recipe, old_amounts,
+                                              new_amounts)
+        bump_version(version_key(Recipe, recipe.pk))
 
     def create(self, validated_data):
         """
@@ -194,6 +309,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tag_data_list)
         self.save_ingredients(recipe, ingredient_data_list)
+        ImageVariantService.schedule(recipe)
         return recipe
 
     def update(self, instance, validated_data):
@@ -202,19 +318,17 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         с ингредиентами при обновлении рецепта.
         """
         if 'ingredients' in validated_data:
-            ingredient_data_list = validated_data.pop('ingredients')
-            RecipeIngredientAmount.objects.filter(recipe=instance).delete()
-            RecipeIngredientAmount.objects.bulk_create([
-                RecipeIngredientAmount(
-                    recipe=instance,
-                    ingredient_id=ingredient.get('id'),
-                    amount=ingredient['amount']
-                )
-                for ingredient in ingredient_data_list
-            ])
+            self.save_ingredients(instance,
+                                  validated_data.pop('ingredients'))
         if 'tags' in validated_data:
             instance.tags.set(validated_data['tags'])
-        return super().update(instance, validated_data)
+        previous_variants = instance.image_variants
+        if 'image' in validated_data:
+            validated_data['image_variants'] = {}
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            ImageVariantService.schedule(instance, previous_variants)
+        return instance
 
     def to_representation(self, instance):
         """
@@ -226,7 +340,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
 class BaseRecipeSerializer(serializers.ModelSerializer):
     """Базовый сериализатор для рецептов."""
-    image = Base64ImageField()
+    image = Base64ImageField(variant='thumbnail')
 
     class Meta:
         model = Recipe
@@ -238,6 +352,21 @@ class BriefRecipeSerializer(BaseRecipeSerializer):
     pass
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    """Сериализатор списка рецептов для пакетных запросов."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_LIMIT
+    )
+
+    def validate_recipes(self, value):
+        """
+        Убирает повторы, сохраняя порядок.
+        """
+        return list(dict.fromkeys(value))
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     """Сериализатор для избранного (добавление и удаление рецептов)."""
 
@@ -282,11 +411,14 @@ class BaseUserSerializer(serializers.ModelSerializer):
         Возвращает список рецептов пользователя
         с ограничением по количеству.
         """
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = obj.recipes.all()
+            if limit:
+                recipes = recipes[:int(limit)]
         serializer = BriefRecipeSerializer(recipes, many=True,
                                            read_only=True)
         return serializer.data
@@ -296,6 +428,8 @@ class BaseUserSerializer(serializers.ModelSerializer):
         """
         Возвращает общее количество рецептов у пользователя.
         """
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     class Meta:
@@ -0,0 +1,212 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from recipes.models import (RecipeIngredientAmount,
+                            ShoppingCart,
+                            ShoppingListItem)
+
+# Изменения корзин и рецептов, которые сервис учитывает приращениями
+# сам: обработчики сигналов (api.signals) их не пересчитывают
+applying_deltas = ContextVar('applying_deltas', default=False)
+
+
+class ShoppingListService:
+    """
+    Сервис поддержки агрегированного списка покупок пользователей.
+
+    ShoppingListItem хранит суммарное количество каждого ингредиента
+    в корзине пользователя. API обновляет его приращениями при
+    изменении корзины или состава рецептов; прочие изменения моделей
+    (админка, каскадное удаление) пересобирают списки затронутых
+    пользователей после фиксации транзакции, см. api.signals.
+    """
+    @staticmethod
+    @contextmanager
+    def applying_deltas():
+        """
+        Блок, изменения в котором учтены приращениями: сигналы
+        не запускают пересборку списков.
+        """
+        token = applying_deltas.set(True)
+        try:
+            yield
+        finally:
+            applying_deltas.reset(token)
+
+    @staticmethod
+    def get_recipe_amounts(recipe):
+        """
+        Количество ингредиентов рецепта в виде {ingredient_id: amount}.
+        """
+        return dict(RecipeIngredientAmount.objects.filter(
+            recipe=recipe).values_list('ingredient_id', 'amount'))
+
+    @staticmethod
+    def get_recipes_amounts(recipe_ids):
+        """
+        Суммарное количество ингредиентов нескольких рецептов
+        в виде {ingredient_id: amount}.
+        """
+        return dict(RecipeIngredientAmount.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id').annotate(
+            total_amount=Sum('amount')
+        ).order_by().values_list('ingredient_id', 'total_amount'))
+
+    @staticmethod
+    def apply_delta(user_ids, deltas):
+        """
+        Прибавляет приращения {ingredient_id: delta} к спискам покупок
+        пользователей и удаляет обнулившиеся позиции.
+        """
+        user_ids = list(user_ids)
+        deltas = {ingredient_id: delta
+                  for ingredient_id, delta in deltas.items() if delta}
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.bulk_create(
+                [ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+                 for user_id in user_ids
+                 for ingredient_id in deltas],
+                ignore_conflicts=True
+            )
+            ShoppingListItem.objects.filter(
+                user_id__in=user_ids,
+                ingredient_id__in=deltas
+            ).update(amount=Greatest(F('amount') + Case(
+                *(When(ingredient_id=ingredient_id, then=Value(delta))
+                  for ingredient_id, delta in deltas.items()),
+                default=Value(0),
+                output_field=IntegerField()
+            ), Value(0)))
+            ShoppingListItem.objects.filter(
+                user_id__in=user_ids,
+                amount__lte=0
+            ).delete()
+
+    @classmethod
+    def add_recipes(cls, user, recipe_ids):
+        """
+        Учитывает добавление нескольких рецептов в корзину пользователя.
+        """
+        cls.apply_delta([user.id], cls.get_recipes_amounts(recipe_ids))
+
+    @classmethod
+    def remove_recipes(cls, user, recipe_ids):
+        """
+        Учитывает удаление нескольких рецептов из корзины пользователя.
+        """
+        cls.apply_delta([user.id], {
+            ingredient_id: -amount
+            for ingredient_id, amount
+            in cls.get_recipes_amounts(recipe_ids).items()})
+
+    @classmethod
+    def change_recipe(cls, recipe, old_amounts, new_amounts):
+        """
+        Учитывает изменение состава рецепта у всех пользователей,
+        у которых он лежит в корзине.
+        """
+        deltas = {
+            ingredient_id: (new_amounts.get(ingredient_id, 0)
+                            - old_amounts.get(ingredient_id, 0))
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()}
+        user_ids = ShoppingCart.objects.filter(
+            recipe=recipe).values_list('user_id', flat=True)
+        cls.apply_delta(user_ids, deltas)
+
+    @classmethod
+    def delete_recipe(cls, recipe):
+        """
+        Учитывает удаление рецепта у всех пользователей,
+        у которых он лежит в корзине.
+        """
+        cls.change_recipe(recipe, cls.get_recipe_amounts(recipe), {})
+
+    @staticmethod
+    def get_live_totals(user_ids=None):
+        """
+        Пересчитывает списки покупок по корзинам всех пользователей
+        или только user_ids: {(user_id, ingredient_id): amount}.
+        """
+        # Одно условие на корзины: второй filter() по той же связи
+        # добавил бы еще одно соединение и умножил суммы
+        condition = ({'recipe__in_shopping_carts__isnull': False}
+                     if user_ids is None else
+                     {'recipe__in_shopping_carts__user__in': user_ids})
+        totals = RecipeIngredientAmount.objects.filter(
+            **condition
+        ).values(
+            'recipe__in_shopping_carts__user',
+            'ingredient'
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by().values_list(
+            'recipe__in_shopping_carts__user',
+            'ingredient',
+            'total_amount'
+        )
+        return {(user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in totals}
+
+    @staticmethod
+    def get_stored_totals():
+        """
+        Сохраненные списки покупок: {(user_id, ingredient_id): amount}.
+        """
+        return {(user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount
+                in ShoppingListItem.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount')}
+
+    @classmethod
+    def rebuild(cls, batch_size=None):
+        """
+        Полностью пересобирает списки покупок по корзинам.
+        """
+        items = [
+            ShoppingListItem(user_id=user_id,
+                             ingredient_id=ingredient_id,
+                             amount=amount)
+            for (user_id, ingredient_id), amount
+            in cls.get_live_totals().items()]
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(items,
+                                                 batch_size=batch_size)
+        return len(items)
+
+    @classmethod
+    def rebuild_users(cls, user_ids):
+        """
+        Пересобирает списки покупок пользователей по их корзинам.
+        """
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        items = [
+            ShoppingListItem(user_id=user_id,
+                             ingredient_id=ingredient_id,
+                             amount=amount)
+            for (user_id, ingredient_id), amount
+            in cls.get_live_totals(user_ids).items()]
+        with transaction.atomic():
+            ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+            ShoppingListItem.objects.bulk_create(items)
+
+    @classmethod
+    def rebuild_users_on_commit(cls, user_ids):
+        """
+        Пересобирает списки покупок пользователей после фиксации
+        транзакции, если изменение не учтено приращениями.
+        """
+        if applying_deltas.get():
+            return
+        user_ids = set(user_ids)
+        if user_ids:
+            transaction.on_commit(lambda: cls.rebuild_users(user_ids))
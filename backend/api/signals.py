@@ -0,0 +1,173 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (Favorite, Ingredient, Recipe,
+                            RecipeIngredientAmount, ShoppingCart, Tag)
+from users.models import Subscription, User
+from .authentication import invalidate_tokens
+from .recipe_service import RecipeService
+from .shopping_list_service import ShoppingListService
+from .versions import bump_version, user_state_key, version_key
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def bump_model_version(sender, **kwargs):
+    """Меняет версию справочника при изменении его записей."""
+    bump_version(version_key(sender))
+
+
+@receiver((post_save, post_delete), sender=User)
+def bump_users_version(sender, instance, update_fields=None, **kwargs):
+    """Меняет версию пользователей, кроме обновления last_login."""
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_version(version_key(sender))
+    bump_version(version_key(sender, instance.pk))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    """Меняет версию рецепта при его изменении или удалении."""
+    bump_version(version_key(Recipe, instance.pk))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """Меняет версию рецептов при изменении их тегов."""
+    if not action.startswith('post_'):
+        return
+    recipe_ids = (pk_set or ()) if reverse else (instance.pk,)
+    for recipe_id in recipe_ids:
+        bump_version(version_key(Recipe, recipe_id))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+def bump_user_state_version(sender, instance, **kwargs):
+    """
+    Меняет версию избранного, корзины и подписок пользователя
+    при изменении через модель, например из админки. API создает
+    и удаляет эти связи в обход сигналов, версию меняют
+    RecipeService и SubscribeMixin.
+    """
+    bump_version(user_state_key(instance.user_id))
+    saved_link = get_saved_link(instance, kwargs['signal'])
+    if saved_link and saved_link[0] != instance.user_id:
+        bump_version(user_state_key(saved_link[0]))
+
+
+def get_saved_link(instance, signal):
+    """Связь до сохранения: (user_id, recipe_id) или None."""
+    if signal is not post_save:
+        return None
+    return getattr(instance, '_saved_link', None)
+
+
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=ShoppingCart)
+def remember_saved_link(sender, instance, **kwargs):
+    """
+    Запоминает пользователя и рецепт сохраняемой связи до изменения:
+    при правке в админке они могут смениться.
+    """
+    instance._saved_link = None
+    if instance.pk is not None:
+        instance._saved_link = sender.objects.filter(
+            pk=instance.pk).values_list('user_id', 'recipe_id').first()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_saved_link(sender, instance, signal, raw=False, **kwargs):
+    """
+    Обновляет счетчики рецептов при сохранении связи через модель.
+    Загрузка фикстур (raw) счетчики не меняет: они есть в данных.
+    """
+    saved_link = get_saved_link(instance, signal)
+    if raw or saved_link == (instance.user_id, instance.recipe_id):
+        return
+    if saved_link is not None:
+        RecipeService.change_counters([saved_link[1]], sender, -1)
+    RecipeService.change_counters([instance.recipe_id], sender, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def uncount_deleted_link(sender, instance, **kwargs):
+    """
+    Обновляет счетчики рецепта при удалении связи через модель:
+    в админке или вместе с пользователем.
+    """
+    RecipeService.change_counters([instance.recipe_id], sender, -1)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Сбрасывает кэш аутентификации при выходе (удалении токена)."""
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """
+    Сбрасывает кэш аутентификации пользователя при его изменении:
+    смене пароля, деактивации, правке профиля.
+    """
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate_tokens(*Token.objects.filter(user_id=instance.pk)
+                      .values_list('key', flat=True))
+
+
+def get_cart_user_ids(recipe_ids):
+    return ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids).values_list('user_id', flat=True)
+
+
+def get_saved_values(instance, field):
+    """Значение поля до сохранения и после него."""
+    values = {getattr(instance, field)}
+    if instance.pk is not None:
+        values.update(type(instance).objects.filter(
+            pk=instance.pk).values_list(field, flat=True))
+    return values
+
+
+@receiver(pre_delete, sender=Recipe)
+def rebuild_recipe_shopping_lists(sender, instance, **kwargs):
+    """
+    Пересобирает списки покупок пользователей, у которых удаляемый
+    рецепт лежит в корзине (удаление в админке или вместе с автором).
+    Корзины читаются до удаления, сборка — после фиксации.
+    """
+    ShoppingListService.rebuild_users_on_commit(
+        get_cart_user_ids([instance.pk]))
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def rebuild_cart_shopping_lists(sender, instance, **kwargs):
+    """
+    Пересобирает список покупок владельца корзины (прежнего
+    и нового при смене пользователя) при изменении через модель.
+    """
+    saved_link = get_saved_link(instance, kwargs['signal'])
+    ShoppingListService.rebuild_users_on_commit(
+        [instance.user_id, *saved_link[:1]] if saved_link
+        else [instance.user_id])
+
+
+@receiver(pre_save, sender=RecipeIngredientAmount)
+@receiver(post_delete, sender=RecipeIngredientAmount)
+def rebuild_ingredient_shopping_lists(sender, instance, **kwargs):
+    """
+    Пересобирает списки покупок пользователей, у которых рецепт
+    с измененным составом лежит в корзине.
+    """
+    ShoppingListService.rebuild_users_on_commit(get_cart_user_ids(
+        get_saved_values(instance, 'recipe_id')
+        if kwargs.get('signal') is pre_save else [instance.recipe_id]))
@@ -0,0 +1,897 @@
+import asyncio
+import base64
+import io
+import re
+import struct
+import threading
+import time
+import unittest
+import warnings
+import zlib
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.db import connection, connections, router, transaction
+from django.db.backends.signals import connection_created
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from PIL import Image
+from reportlab.pdfbase import pdfmetrics
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, Recipe,
+                            RecipeIngredientAmount, ShoppingCart,
+                            ShoppingListItem, Tag)
+from users.models import User
+from .async_views import offload_patterns
+from .authentication import token_cache_key
+from .autocomplete import ingredient_index
+from .db_router import replica_reads
+from .fields import Base64ImageField
+from .filters import RecipeSearchFilter
+from .image_service import ImageVariantService
+from .middleware import (QueryMetricsMiddleware, ReplicaRoutingMiddleware,
+                         install_query_counter)
+from .recipe_cache import recipe_payload_cache
+from .recipe_service import RecipeService
+from .renderers import ShoppingListPDFRenderer, ShoppingListRenderer
+from .serializers import FullRecipeSerializer
+from .shopping_list_service import ShoppingListService
+from .urls import ASYNC_ROUTES, router as api_router
+
+# Маршруты API с асинхронными обертками, как при ASYNC_READ_PATH
+urlpatterns = [
+    path('api/', include(offload_patterns(api_router.urls, ASYNC_ROUTES))),
+]
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}', email=f'user{number}@example.com',
+        password='password', first_name='Имя', last_name='Фамилия')
+
+
+def create_recipes(author, count, ingredients=()):
+    """Создает рецепты автора, каждый со всеми ингредиентами."""
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {number}', text='Описание',
+            cooking_time=10, image='recipes/images/test.png')
+        RecipeIngredientAmount.objects.bulk_create(
+            RecipeIngredientAmount(recipe=recipe, ingredient=ingredient,
+                                   amount=index + 1)
+            for index, ingredient in enumerate(ingredients))
+        recipes.append(recipe)
+    return recipes
+
+
+def run_concurrently(function, count):
+    """
+    Запускает функцию в нескольких потоках одновременно
+    и возвращает ее результаты.
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+    errors = []
+
+    def worker(number):
+        try:
+            barrier.wait()
+            results[number] = function()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(number,))
+               for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class RecipeQueryBudgetTests(TestCase):
+    """
+    Число запросов к ленте и странице рецепта не зависит
+    от количества ингредиентов и тегов.
+    """
+
+    page_size = 6
+    # Аноним: рецепты с автором, теги, ингредиенты, число рецептов
+    # (в ленте). Пользователь: еще токен и его подписки
+    budgets = {
+        ('list', False): 4,
+        ('list', True): 6,
+        ('detail', False): 3,
+        ('detail', True): 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(1)
+        cls.reader = create_user(2)
+        cls.token = Token.objects.create(user=cls.reader).key
+        cls.tags = [Tag.objects.create(name=f'Тег {number}',
+                                       color=f'#00000{number}',
+                                       slug=f'tag{number}')
+                    for number in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(10)]
+
+    def setUp(self):
+        # Кэш рецептов и токенов не должен скрывать запросы
+        clear_caches()
+
+    def create_feed(self, ingredient_count):
+        recipes = create_recipes(self.author, self.page_size,
+                                 self.ingredients[:ingredient_count])
+        for recipe in recipes:
+            recipe.tags.set(self.tags[:ingredient_count % 3 + 1])
+        Favorite.objects.create(user=self.reader, recipe=recipes[0])
+        return recipes
+
+    def get_client(self, authenticated):
+        client = APIClient()
+        if authenticated:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        return client
+
+    def assert_budget(self, ingredient_count):
+        recipes = self.create_feed(ingredient_count)
+        urls = {'list': f'/api/recipes/?limit={self.page_size}',
+                'detail': f'/api/recipes/{recipes[0].pk}/'}
+        for (view, authenticated), budget in self.budgets.items():
+            clear_caches()
+            with self.subTest(view=view, authenticated=authenticated,
+                              ingredients=ingredient_count):
+                client = self.get_client(authenticated)
+                with self.assertNumQueries(budget):
+                    response = client.get(urls[view])
+                self.assertEqual(response.status_code, 200)
+
+    def test_few_ingredients(self):
+        self.assert_budget(1)
+
+    def test_many_ingredients(self):
+        self.assert_budget(10)
+
+
+class ConditionalGetTests(TestCase):
+    """Условные GET-запросы к справочникам."""
+
+    def setUp(self):
+        clear_caches()
+
+    def test_write_in_same_second_is_not_hidden(self):
+        with mock.patch('api.versions.time.time', return_value=1000.2):
+            Tag.objects.create(name='Первый', color='#000001', slug='one')
+            first = self.client.get('/api/tags/')
+        self.assertEqual(first['Last-Modified'],
+                         'Thu, 01 Jan 1970 00:16:41 GMT')
+        self.assertEqual(self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+            304)
+        with mock.patch('api.versions.time.time', return_value=1000.7):
+            Tag.objects.create(name='Второй', color='#000002', slug='two')
+        for headers in ({'HTTP_IF_MODIFIED_SINCE': first['Last-Modified']},
+                        {'HTTP_IF_NONE_MATCH': first['ETag']}):
+            with self.subTest(headers=headers):
+                response = self.client.get('/api/tags/', **headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), 2)
+
+
+class RecipePaginationTests(TestCase):
+    """Курсорная пагинация ленты и сортировка."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipes(create_user(1), 3)
+
+    def test_cursor_with_ordering_is_rejected(self):
+        for query in ('pagination=cursor&ordering=popular',
+                      'cursor=cD0yMDI0&ordering=popular'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ordering', response.json())
+
+    def test_ordering_and_cursor_separately(self):
+        response = self.client.get('/api/recipes/?ordering=popular')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('count', response.json())
+        response = self.client.get('/api/recipes/?pagination=cursor')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.json())
+
+
+class RecipeFilterIndexTests(TestCase):
+    """Индексы для фильтров ленты рецептов."""
+
+    indexes = {
+        'recipes_recipe': {'recipe_author_pub_date_idx':
+                           ['author_id', 'pub_date']},
+        'recipes_recipe_tags': {'recipe_tags_tag_recipe_idx':
+                                ['tag_id', 'recipe_id']},
+        'recipes_favorite': {'favorite_user_recipe_idx':
+                             ['user_id', 'recipe_id']},
+        'recipes_shoppingcart': {'shopping_cart_user_recipe_idx':
+                                 ['user_id', 'recipe_id']},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.tag = Tag.objects.create(name='Тег', color='#000000',
+                                     slug='tag')
+        recipes = create_recipes(cls.user, 3)
+        recipes[0].tags.add(cls.tag)
+        Favorite.objects.create(user=cls.user, recipe=recipes[0])
+
+    def test_indexes_exist(self):
+        with connection.cursor() as cursor:
+            for table, indexes in self.indexes.items():
+                constraints = connection.introspection.get_constraints(
+                    cursor, table)
+                for name, columns in indexes.items():
+                    with self.subTest(index=name):
+                        self.assertIn(name, constraints)
+                        self.assertTrue(constraints[name]['index'])
+                        self.assertEqual(constraints[name]['columns'],
+                                         columns)
+
+    def explain(self, data):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return RecipeSearchFilter(
+            data, queryset=Recipe.objects.order_by('-pub_date'),
+            request=request).qs.explain()
+
+    @unittest.skipUnless(connection.vendor == 'sqlite',
+                         'План проверяется для SQLite')
+    def test_filters_use_indexes(self):
+        self.assertIn('USING INDEX recipe_author_pub_date_idx',
+                      self.explain({'author': self.user.pk}))
+        self.assertIn('USING COVERING INDEX recipe_tags_tag_recipe_idx',
+                      self.explain({'tags': [self.tag.slug]}))
+        # EXISTS по избранному читает только индекс пары (user, recipe)
+        self.assertRegex(self.explain({'is_favorited': '1'}),
+                         r'SEARCH U0 USING COVERING INDEX \w*favorite')
+
+
+class RecipeBatchTests(TestCase):
+    """Пакетное добавление и удаление связей с рецептами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(2)]
+        cls.recipes = create_recipes(cls.user, 3, cls.ingredients)
+        cls.ids = [recipe.pk for recipe in cls.recipes]
+
+    def test_existing_link_is_not_counted(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        results = RecipeService.add_many(self.user, [*self.ids, 0],
+                                         Favorite)
+        self.assertEqual(results, {self.ids[0]: 'exists',
+                                   self.ids[1]: 'added',
+                                   self.ids[2]: 'added',
+                                   0: 'not_found'})
+        self.assertEqual(
+            list(Recipe.objects.filter(pk__in=self.ids).order_by('pk')
+                 .values_list('favorites_count', flat=True)),
+            [1, 1, 1])
+
+    def test_missing_link_is_not_uncounted(self):
+        RecipeService.add_many(self.user, self.ids[:1], ShoppingCart)
+        results = RecipeService.remove_many(self.user, self.ids,
+                                            ShoppingCart)
+        self.assertEqual(results, {self.ids[0]: 'removed',
+                                   self.ids[1]: 'absent',
+                                   self.ids[2]: 'absent'})
+        self.assertFalse(Recipe.objects.filter(
+            shopping_carts_count__gt=0).exists())
+        self.assertFalse(ShoppingListItem.objects.filter(
+            amount__gt=0).exists())
+
+
+class RecipeCountersTests(TestCase):
+    """
+    Счетчики избранного и корзин: не сбрасывают кэш рецепта
+    и поддерживаются при изменениях через модель.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.recipe = create_recipes(cls.user, 1)[0]
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def get_counts(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.favorites_count, self.recipe.shopping_carts_count
+
+    def test_toggle_keeps_payload_cache(self):
+        first = self.client.get(self.url)
+        request = RequestFactory().get(self.url)
+        keys = recipe_payload_cache.get_keys([self.recipe], request)
+        self.assertEqual(len(recipe_payload_cache.get_many(keys)), 1)
+        self.client.post(f'{self.url}favorite/')
+        self.assertEqual(
+            recipe_payload_cache.get_keys([self.recipe], request), keys)
+        # Рецепт с признаками пользователя и его подписки, без отрисовки
+        with self.assertNumQueries(2):
+            second = self.client.get(self.url,
+                                     HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['favorites_count'], 1)
+        self.assertTrue(second.data['is_favorited'])
+
+    def test_model_changes_update_counters(self):
+        favorite = Favorite.objects.create(user=self.user,
+                                           recipe=self.recipe)
+        cart = ShoppingCart.objects.create(user=self.user,
+                                           recipe=self.recipe)
+        self.assertEqual(self.get_counts(), (1, 1))
+        other = create_recipes(self.user, 1)[0]
+        favorite.recipe = other
+        favorite.save()
+        self.assertEqual(self.get_counts(), (0, 1))
+        other.refresh_from_db()
+        self.assertEqual(other.favorites_count, 1)
+        cart.delete()
+        self.assertEqual(self.get_counts(), (0, 0))
+
+
+class ShoppingListModelChangesTests(TestCase):
+    """
+    Список покупок остается верным при изменениях в обход API:
+    в админке и при каскадном удалении.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(1)
+        cls.buyer = create_user(2)
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(2)]
+        cls.recipes = create_recipes(cls.author, 2, cls.ingredients)
+        RecipeService.add_many(cls.buyer, [recipe.pk
+                                           for recipe in cls.recipes],
+                               ShoppingCart)
+
+    def assert_synced(self, **expected_counts):
+        stored = {(item.user_id, item.ingredient_id): item.amount
+                  for item in ShoppingListItem.objects.all()}
+        self.assertEqual(stored, ShoppingListService.get_live_totals())
+        for username, count in expected_counts.items():
+            self.assertEqual(len([
+                1 for user_id, _ in stored
+                if user_id == getattr(self, username).pk]), count)
+
+    def test_cart_saved_and_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cart = ShoppingCart.objects.create(user=self.author,
+                                               recipe=self.recipes[0])
+        self.assert_synced(author=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            cart.user = self.buyer
+            ShoppingCart.objects.filter(user=self.buyer,
+                                        recipe=self.recipes[0]).delete()
+            cart.save()
+        self.assert_synced(author=0, buyer=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingCart.objects.filter(user=self.buyer).delete()
+        self.assert_synced(buyer=0)
+
+    def test_recipe_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[0].delete()
+        self.assert_synced(buyer=2)
+
+    def test_author_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.delete()
+        self.assert_synced(buyer=0)
+
+    def test_ingredient_amount_changed(self):
+        amount = RecipeIngredientAmount.objects.filter(
+            recipe=self.recipes[0]).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            amount.amount = 50
+            amount.save()
+        self.assert_synced(buyer=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            amount.delete()
+        self.assert_synced(buyer=2)
+
+    def test_api_changes_apply_deltas(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = client.delete(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(callbacks, [])
+        self.assert_synced(buyer=2)
+
+
+class ConcurrentRecipeBatchTests(TransactionTestCase):
+    """
+    Параллельные пакетные запросы: каждая связь учитывается
+    в счетчиках и списке покупок ровно один раз.
+    """
+
+    threads = 4
+
+    def setUp(self):
+        self.user = create_user(1)
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(2)]
+        self.ids = [recipe.pk
+                    for recipe in create_recipes(self.user, 5, ingredients)]
+
+    def assert_consistent(self, linked):
+        self.assertEqual(ShoppingCart.objects.count(),
+                         len(self.ids) if linked else 0)
+        self.assertEqual(
+            set(Recipe.objects.values_list('favorites_count',
+                                           'shopping_carts_count')),
+            {(int(linked), int(linked))})
+        stored = {(item.user_id, item.ingredient_id): item.amount
+                  for item in ShoppingListItem.objects.filter(
+                      amount__gt=0)}
+        live = {key: amount for key, amount
+                in ShoppingListService.get_live_totals().items() if amount}
+        self.assertEqual(stored, live)
+
+    def run_batches(self, method):
+        def change():
+            return (method(self.user, self.ids, Favorite),
+                    method(self.user, self.ids, ShoppingCart))
+        return run_concurrently(change, self.threads)
+
+    def test_overlapping_batches(self):
+        results = self.run_batches(RecipeService.add_many)
+        for recipe_id in self.ids:
+            self.assertEqual(
+                [favorite[recipe_id] for favorite, _ in results].count(
+                    'added'), 1)
+        self.assertEqual(Favorite.objects.count(), len(self.ids))
+        self.assert_consistent(True)
+
+        results = self.run_batches(RecipeService.remove_many)
+        for recipe_id in self.ids:
+            self.assertEqual(
+                [cart[recipe_id] for _, cart in results].count('removed'),
+                1)
+        self.assertFalse(Favorite.objects.exists())
+        self.assert_consistent(False)
+
+
+class ConcurrentRecipeEndpointTests(TransactionTestCase):
+    """
+    Параллельные запросы к избранному и корзине через API:
+    связь создается и удаляется ровно один раз.
+    """
+
+    threads = 4
+
+    def setUp(self):
+        self.user = create_user(1)
+        self.token = Token.objects.create(user=self.user).key
+        self.recipes = create_recipes(self.user, 2)
+
+    def request(self, method, url, data=None):
+        def send():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+            return getattr(client, method)(url, data,
+                                           format='json').status_code
+        return sorted(run_concurrently(send, self.threads))
+
+    def test_single_favorite(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/favorite/'
+        self.assertEqual(self.request('post', url),
+                         [201] + [400] * (self.threads - 1))
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].favorites_count, 1)
+        self.assertEqual(self.request('delete', url),
+                         [200] + [404] * (self.threads - 1))
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].favorites_count, 0)
+
+    def test_batch_shopping_cart(self):
+        data = {'recipes': [recipe.pk for recipe in self.recipes]}
+        self.assertEqual(
+            self.request('post', '/api/recipes/shopping_cart/', data),
+            [200] * self.threads)
+        self.assertEqual(ShoppingCart.objects.count(), len(self.recipes))
+        self.assertEqual(
+            set(Recipe.objects.values_list('shopping_carts_count',
+                                           flat=True)), {1})
+        self.request('delete', '/api/recipes/shopping_cart/', data)
+        self.assertEqual(
+            set(Recipe.objects.values_list('shopping_carts_count',
+                                           flat=True)), {0})
+
+
+def png_chunk(chunk_type, data):
+    return (struct.pack('>I', len(data)) + chunk_type + data
+            + struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+
+def png_header(width, height):
+    """
+    PNG с заголовком IHDR заданного размера и без пикселей:
+    так выглядит «бомба распаковки» до чтения данных.
+    """
+    return (b'\x89PNG\r\n\x1a\n'
+            + png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height,
+                                             8, 2, 0, 0, 0))
+            + png_chunk(b'IDAT', b'') + png_chunk(b'IEND', b''))
+
+
+class ImageVariantServiceTests(TestCase):
+    """Уменьшенные копии фото рецептов."""
+
+    def setUp(self):
+        self.storage = Recipe._meta.get_field('image').storage
+        self.recipe = create_recipes(create_user(1), 1)[0]
+
+    def save_image(self, name):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(buffer, 'PNG')
+        name = self.storage.save(name, ContentFile(buffer.getvalue()))
+        self.addCleanup(self.storage.delete, name)
+        return name
+
+    def get_files(self, variants):
+        return [path for name in variants.values()
+                for path in (name, name + '.webp')]
+
+    def test_variant_names_keep_extension(self):
+        self.assertNotEqual(
+            ImageVariantService.get_variant_name('images/temp.png', 'medium'),
+            ImageVariantService.get_variant_name('images/temp.jpeg',
+                                                 'medium'))
+
+    def test_previous_variants_deleted(self):
+        first = self.save_image('recipes/images/first.png')
+        Recipe.objects.filter(pk=self.recipe.pk).update(image=first)
+        old_variants = ImageVariantService.process(self.recipe.pk, first)
+        self.assertTrue(all(map(self.storage.exists,
+                                self.get_files(old_variants))))
+
+        second = self.save_image('recipes/images/second.png')
+        Recipe.objects.filter(pk=self.recipe.pk).update(image=second,
+                                                        image_variants={})
+        new_variants = ImageVariantService.process(self.recipe.pk, second,
+                                                   old_variants)
+        self.addCleanup(ImageVariantService.delete_variants, self.storage,
+                        new_variants)
+        self.assertFalse(any(map(self.storage.exists,
+                                 self.get_files(old_variants))))
+        self.assertTrue(all(map(self.storage.exists,
+                                self.get_files(new_variants))))
+
+        # Фото сменилось во время нарезки: ее копии не остаются
+        stale_variants = ImageVariantService.process(self.recipe.pk, first)
+        self.assertFalse(any(map(self.storage.exists,
+                                 self.get_files(stale_variants))))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, new_variants)
+
+
+class ShoppingListRendererTests(TestCase):
+    """Файлы списка покупок."""
+
+    rows = [('соль', 'г', 5), ('шафран', 'г', 1)]
+
+    def test_base_renderer_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ShoppingListRenderer()
+
+    def test_pdf_embeds_cyrillic_font(self):
+        content = b''.join(ShoppingListPDFRenderer().stream(self.rows))
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'DejaVuSans', content)
+
+    @override_settings(SHOPPING_LIST_PDF_FONT='/missing/font.ttf')
+    def test_missing_font_fails_before_streaming(self):
+        with mock.patch.object(pdfmetrics, 'getRegisteredFontNames',
+                               return_value=[]):
+            with self.assertRaises(ImproperlyConfigured):
+                ShoppingListPDFRenderer().stream(self.rows)
+
+
+class Base64ImageFieldTests(TestCase):
+    """Проверки размера изображений в Base64ImageField."""
+
+    @staticmethod
+    def encode(data):
+        return 'data:image/png;base64,' + base64.b64encode(data).decode()
+
+    def assert_rejected(self, data, code):
+        with self.assertRaises(ValidationError) as context:
+            Base64ImageField().run_validation(self.encode(data))
+        self.assertEqual(context.exception.get_codes(), [code])
+
+    def test_decompression_bomb_header(self):
+        self.assert_rejected(png_header(20000, 20000), 'too_many_pixels')
+
+    def test_decompression_bomb_warning_as_error(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            self.assert_rejected(png_header(10000, 10000),
+                                 'too_many_pixels')
+
+    def test_invalid_base64(self):
+        with self.assertRaises(ValidationError) as context:
+            Base64ImageField().run_validation('data:image/png;base64,@@@@')
+        self.assertEqual(context.exception.get_codes(), ['invalid_base64'])
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    MIDDLEWARE=['api.middleware.QueryMetricsMiddleware',
+                *settings.MIDDLEWARE])
+class AsyncReadPathMetricsTests(TransactionTestCase):
+    """
+    Метрики запросов для представлений, выполняемых в пуле потоков
+    под ASGI, совпадают с метриками под WSGI.
+    """
+
+    def setUp(self):
+        connection_created.connect(install_query_counter)
+        self.addCleanup(connection_created.disconnect,
+                        install_query_counter)
+        # Соединение основного потока открыто до подключения сигнала
+        connection = connections['default']
+        install_query_counter(None, connection)
+        self.addCleanup(connection.execute_wrappers.clear)
+        self.user = create_user(1)
+        create_recipes(self.user, 3)
+
+    @staticmethod
+    def get_queries(response):
+        return int(re.search(r'desc="(\d+) queries"',
+                             response['Server-Timing']).group(1))
+
+    def test_middlewares_are_async_capable(self):
+        async def get_response(request):
+            return None
+
+        for middleware in (QueryMetricsMiddleware, ReplicaRoutingMiddleware):
+            self.assertTrue(asyncio.iscoroutinefunction(
+                middleware(get_response)))
+            self.assertFalse(asyncio.iscoroutinefunction(
+                middleware(lambda request: None)))
+
+    def test_async_queries_counted(self):
+        sync_response = self.client.get('/api/recipes/')
+        # Второй запрос не должен брать рецепты из кэша
+        clear_caches()
+        async_response = asyncio.run(self.async_client.get('/api/recipes/'))
+        self.assertEqual(async_response.status_code, 200)
+        self.assertGreater(self.get_queries(sync_response), 0)
+        self.assertEqual(self.get_queries(async_response),
+                         self.get_queries(sync_response))
+        self.assertNotIn('render;dur=0.0,', async_response['Server-Timing'])
+
+    def test_serialization_timed_separately(self):
+        to_representation_many = FullRecipeSerializer.to_representation_many
+
+        def slow_to_representation_many(serializer, recipes):
+            time.sleep(0.06)
+            return to_representation_many(serializer, recipes)
+
+        with mock.patch.object(FullRecipeSerializer,
+                               'to_representation_many',
+                               slow_to_representation_many):
+            sync_response = self.client.get('/api/recipes/')
+            clear_caches()
+            async_response = asyncio.run(
+                self.async_client.get('/api/recipes/'))
+        for response in (sync_response, async_response):
+            timings = dict(re.findall(r'(\w+);dur=([\d.]+)',
+                                      response['Server-Timing']))
+            self.assertGreaterEqual(float(timings['serialize']), 60)
+            # Время сериализации не входит во время view и БД
+            self.assertLessEqual(
+                sum(float(timings[name]) for name in
+                    ('db', 'view', 'serialize', 'render')),
+                float(timings['total']) + 0.5)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Чтение из реплики для безопасных запросов, запись и транзакции —
+    в основной базе, после записи клиент закреплен за основной базой.
+    В тестовых настройках реплика — зеркало основной базы.
+    """
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        clear_caches()
+        self.user = create_user(1)
+        self.token = Token.objects.create(user=self.user).key
+        self.recipe = create_recipes(self.user, 1)[0]
+
+    def test_router(self):
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+        token = replica_reads.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Recipe), 'replica')
+            self.assertEqual(router.db_for_read(Token), 'default')
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Recipe), 'default')
+        finally:
+            replica_reads.reset(token)
+
+    def request(self, method, authorization='Token first', **headers):
+        """Возвращает, было ли разрешено чтение из реплики."""
+        allowed = []
+
+        def get_response(request):
+            allowed.append(replica_reads.get())
+            return None
+
+        if authorization:
+            headers['HTTP_AUTHORIZATION'] = authorization
+        request = getattr(RequestFactory(), method)('/', **headers)
+        ReplicaRoutingMiddleware(get_response)(request)
+        return allowed[0]
+
+    @override_settings(REPLICA_STICKY_SECONDS=1)
+    def test_sticky_primary_after_write(self):
+        self.assertTrue(self.request('get'))
+        self.assertFalse(self.request('post'))
+        self.assertFalse(self.request('get'))
+        self.assertTrue(self.request('get', 'Token second'))
+        time.sleep(1.1)
+        self.assertTrue(self.request('get'))
+
+    def test_anonymous_clients_behind_proxy_pinned_separately(self):
+        first = {'authorization': None, 'HTTP_X_REAL_IP': '10.0.0.1'}
+        second = {'authorization': None, 'HTTP_X_REAL_IP': '10.0.0.2'}
+        self.assertFalse(self.request('post', **first))
+        self.assertFalse(self.request('get', **first))
+        self.assertTrue(self.request('get', **second))
+
+    def test_recent_changes_not_cached_from_replica(self):
+        token = replica_reads.set(True)
+        try:
+            # Рецепт только что создан: реплика могла его еще не получить
+            self.assertEqual(
+                recipe_payload_cache.get_keys([self.recipe]), {})
+            with override_settings(REPLICA_MAX_LAG_SECONDS=0):
+                self.assertEqual(
+                    list(recipe_payload_cache.get_keys([self.recipe])),
+                    [self.recipe.pk])
+            with CaptureQueriesContext(connections['replica']) as replica:
+                ingredient_index.search('соль', 10)
+            self.assertEqual(len(replica), 0)
+        finally:
+            replica_reads.reset(token)
+        primary, replica = self.get_queries(
+            APIClient(), 'get', f'/api/recipes/{self.recipe.pk}/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def get_queries(self, client, method, url):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(client, method)(url)
+        self.assertLess(response.status_code, 400)
+        return len(primary), len(replica)
+
+    @override_settings(REPLICA_MAX_LAG_SECONDS=0)
+    def test_requests(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        recipe_url = f'/api/recipes/{self.recipe.pk}/'
+        primary, replica = self.get_queries(APIClient(), 'get', recipe_url)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+        # Токен всегда читается из основной базы
+        primary, replica = self.get_queries(client, 'get', recipe_url)
+        self.assertEqual(primary, 1)
+        self.assertGreater(replica, 0)
+        primary, replica = self.get_queries(
+            client, 'post', f'{recipe_url}favorite/')
+        self.assertEqual(replica, 0)
+        primary, replica = self.get_queries(client, 'get', recipe_url)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Кэш аутентификации по токену."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.token = Token.objects.create(user=cls.user).key
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get_me(self):
+        return self.client.get('/api/users/me/')
+
+    def test_cache_hit_skips_token_query(self):
+        with self.assertNumQueries(2):
+            self.get_me()
+        with self.assertNumQueries(1):
+            response = self.get_me()
+        self.assertEqual(response.data['email'], self.user.email)
+
+    def test_password_hash_is_not_cached(self):
+        self.get_me()
+        cached = caches[settings.TOKEN_CACHE_ALIAS].get(
+            token_cache_key(self.token))
+        self.assertNotIn('password', cached)
+        self.assertNotIn(self.user.password, cached.values())
+        self.assertIsNone(caches['default'].get(token_cache_key(self.token)))
+
+    def test_set_password_with_cached_user(self):
+        self.get_me()
+        response = self.client.post(
+            '/api/users/set_password/',
+            {'current_password': 'password', 'new_password': 'Xq7!pass42'},
+            format='json')
+        self.assertEqual(response.status_code, 204)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(user.check_password('Xq7!pass42'))
+        # Отложенные поля не перезаписаны при сохранении
+        self.assertEqual(user.date_joined, self.user.date_joined)
+        self.assertIsNone(caches[settings.TOKEN_CACHE_ALIAS].get(
+            token_cache_key(self.token)))
+
+    def test_deactivation_and_logout(self):
+        self.get_me()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get_me().status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.save()
+        self.assertEqual(self.get_me().status_code, 401)
+        user.is_active = True
+        user.save()
+        self.assertEqual(self.get_me().status_code, 200)
+        self.client.post('/api/auth/token/logout/')
+        self.assertEqual(self.get_me().status_code, 401)
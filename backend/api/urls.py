@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import offload_patterns
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UsersViewSet
 
 
@@ -14,5 +16,14 @@ router.register('tags', TagViewSet, basename='tags')
 router.register('users', UsersViewSet, basename='users')
 router.register('recipes', RecipeViewSet, basename='recipes')
 
-urlpatterns = (path('', include(router.urls)),
+# Маршруты чтения, которые под ASGI выполняются в пуле потоков
+ASYNC_ROUTES = ('recipes-list', 'recipes-detail',
+                'tags-list', 'tags-detail',
+                'ingredients-list', 'ingredients-detail')
+
+router_urls = router.urls
+if settings.ASYNC_READ_PATH:
+    router_urls = offload_patterns(router_urls, ASYNC_ROUTES)
+
+urlpatterns = (path('', include(router_urls)),
                path('auth/', include('djoser.urls.authtoken')),)
@@ -1,5 +1,3 @@
-from django.shortcuts import get_object_or_404
-
 from rest_framework import status
 from rest_framework.response import Response
 
@@ -8,26 +6,38 @@ from users.models import Subscription
 from .recipe_service import RecipeService
 
 
+def get_followed_author_ids(request):
+    """
+    Id авторов, на которых подписан пользователь запроса.
+    Читаются одним запросом и сохраняются в объекте запроса,
+    поэтому все сериализаторы ответа используют один набор.
+    """
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    author_ids = getattr(request, '_followed_author_ids', None)
+    if author_ids is None:
+        author_ids = frozenset(
+            Subscription.objects.filter(user=request.user)
+            .values_list('author_id', flat=True))
+        request._followed_author_ids = author_ids
+    return author_ids
+
+
 def is_user_subscribed(request, obj):
     """
     Проверка подписки пользователя на объект.
     """
-    return (
-        request.user.is_authenticated
-        and Subscription.objects.filter(user=request.user,
-                                        author=obj).exists()
-    )
+    return obj.pk in get_followed_author_ids(request)
 
 
 def recipe_add_or_del(request, model, pk, custom_serializer):
     """
     Добавление или удаление рецепта из модели связей с пользователем.
     """
-    recipe = get_object_or_404(Recipe, id=pk)
     if request.method == 'POST':
-        added = RecipeService.add(request, recipe, model)
+        added = RecipeService.add(request.user, pk, model)
         if added:
-            serializer = custom_serializer(recipe)
+            serializer = custom_serializer(Recipe.objects.get(pk=pk))
             status_code = status.HTTP_201_CREATED
             response_data = {
                 'detail': f'Рецепт добавлен в {model.__name__}!',
@@ -39,7 +49,7 @@ def recipe_add_or_del(request, model, pk, custom_serializer):
                 'message': f'Рецепт уже добавлен в {model.__name__}'
             }
     else:
-        removed = RecipeService.remove(request, recipe, model)
+        removed = RecipeService.remove(request.user, pk, model)
         if removed:
             status_code = status.HTTP_204_NO_CONTENT
             response_data = {
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from recipes.models import Ingredient
 from .constants import MAX_AMOUNT, MAX_TIME, MINIMUM
 
 
@@ -38,6 +39,25 @@ def validate_ingredient_amount(value):
     return value
 
 
+def validate_ingredient_ids(value):
+    """
+    Проверка, что ингредиенты не повторяются и существуют.
+    Существование проверяется одним запросом.
+    """
+    ingredient_ids = [ingredient['id'] for ingredient in value]
+    unique_ids = set(ingredient_ids)
+    if len(unique_ids) != len(ingredient_ids):
+        raise serializers.ValidationError(
+            'Ингредиенты в рецепте не должны повторяться!')
+    found_ids = set(Ingredient.objects.filter(
+        id__in=unique_ids).values_list('id', flat=True))
+    missing_ids = sorted(unique_ids - found_ids)
+    if missing_ids:
+        raise serializers.ValidationError(
+            f'Ингредиенты не найдены: {missing_ids}')
+    return value
+
+
 def validate_cooking_duration(value):
     """
     Проверка корректности времени приготовления.
@@ -0,0 +1,59 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY_PREFIX = 'version'
+
+
+def version_key(model, pk=None):
+    """
+    Ключ версии модели целиком или отдельного объекта.
+    """
+    key = f'{VERSION_KEY_PREFIX}:{model._meta.label_lower}'
+    return key if pk is None else f'{key}:{pk}'
+
+
+def user_state_key(user_id):
+    """
+    Ключ версии пользовательских связей: избранного, корзины, подписок.
+    """
+    return f'{VERSION_KEY_PREFIX}:user_state:{user_id}'
+
+
+def recipe_counters_key(recipe_id):
+    """
+    Ключ версии счетчиков рецепта: избранного и корзин. Счетчики
+    не входят в кэш сериализованных рецептов, поэтому их изменение
+    не меняет версию самого рецепта.
+    """
+    return f'{VERSION_KEY_PREFIX}:recipe_counters:{recipe_id}'
+
+
+def bump_version(key):
+    """
+    Отмечает изменение данных: версия — время последнего изменения.
+    """
+    cache.set(key, time.time(), None)
+
+
+def get_versions(*keys):
+    """
+    Возвращает версии по ключам. Отсутствующие в кэше версии
+    считаются изменившимися только что.
+    """
+    versions = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            if not cache.add(key, version, None):
+                missing[key] = cache.get(key, version)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def make_etag(*parts):
+    """
+    Строит ETag из версий и прочих влияющих на ответ значений.
+    """
+    return hashlib.md5(repr(parts).encode()).hexdigest()
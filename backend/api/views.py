@@ -1,5 +1,5 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, viewsets
 from rest_framework.decorators import action
@@ -9,47 +9,58 @@ from rest_framework.response import Response
 
 from djoser.views import UserViewSet
 
-from recipes.models import Ingredient, Recipe, Tag, RecipeIngredientAmount
+from recipes.models import Ingredient, Recipe, ShoppingListItem, Tag
 from users.models import User
 
 from .filters import IngredientSearchFilter, RecipeSearchFilter
 from .mixins import (BaseRecipeMixin,
+                     ConditionalGetMixin,
                      FavoriteRecipeMixin,
                      ShoppingCartMixin,
                      SubscribeMixin,
+                     SerializationMetricsMixin,
                      SetPasswordMixin,
                      SubscriptionsMixin)
-from .pagination import CustomPagination
+from .pagination import CustomPagination, OptInCursorPagination
 from .permissions import IsAdminOrAuthorOrReadOnly
+from .renderers import (ShoppingListCSVRenderer,
+                        ShoppingListPDFRenderer,
+                        ShoppingListTextRenderer)
 from .serializers import (IngredientSerializer,
                           RecipeCreateSerializer,
                           FullRecipeSerializer,
                           TagSerializer,
                           UsersSerializer)
-from .constants import NUMBERING
+from .shopping_list_service import ShoppingListService
+from .versions import recipe_counters_key, version_key
+from .constants import SHOPPING_LIST_CHUNK_SIZE
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, SerializationMetricsMixin,
+                        viewsets.ModelViewSet):
     """
     Представление ингредиентов: список, создание, изменение и удаление.
     """
+    version_models = (Ingredient,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalGetMixin, SerializationMetricsMixin,
+                 viewsets.ModelViewSet):
     """
     Представление тегов: список, создание, изменение и удаление.
     """
+    version_models = (Tag,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
 
-class UsersViewSet(UserViewSet, viewsets.GenericViewSet,
+class UsersViewSet(SerializationMetricsMixin,
+                   UserViewSet, viewsets.GenericViewSet,
                    SubscriptionsMixin,
                    SubscribeMixin,
                    SetPasswordMixin):
@@ -64,10 +75,12 @@ class UsersViewSet(UserViewSet, viewsets.GenericViewSet,
     @action(detail=False, permission_classes=[IsAuthenticated])
     def me(self, request):
         serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        return Response(self.get_serialized_data(serializer))
 
 
-class RecipeViewSet(viewsets.ModelViewSet,
+class RecipeViewSet(ConditionalGetMixin,
+                    SerializationMetricsMixin,
+                    viewsets.ModelViewSet,
                     FavoriteRecipeMixin,
                     ShoppingCartMixin,
                     BaseRecipeMixin):
@@ -77,9 +90,37 @@ class RecipeViewSet(viewsets.ModelViewSet,
     """
     queryset = Recipe.objects.all()
     permission_classes = (IsAdminOrAuthorOrReadOnly,)
-    pagination_class = CustomPagination
+    pagination_class = OptInCursorPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeSearchFilter
+    version_models = (Tag, Ingredient, User)
+    conditional_actions = ('retrieve',)
+    user_dependent = True
+
+    def get_version_keys(self):
+        keys = super().get_version_keys()
+        if self.action == 'retrieve':
+            keys.append(version_key(Recipe, self.kwargs['pk']))
+            keys.append(recipe_counters_key(self.kwargs['pk']))
+        return keys
+
+    def get_queryset(self):
+        """
+        Рецепты с признаками текущего пользователя. Автор нужен
+        каждому ответу (is_subscribed), поэтому загружается сразу,
+        а теги и ингредиенты (RecipeQuerySet.related_lookups)
+        подгружает FullRecipeSerializer.to_representation_many
+        только для рецептов, которых нет в кэше представлений.
+        """
+        queryset = Recipe.objects.with_user_flags(self.request.user)
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.select_related('author')
+        return queryset
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(), ShoppingListService.applying_deltas():
+            ShoppingListService.delete_recipe(instance)
+            instance.delete()
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -92,7 +133,7 @@ class RecipeViewSet(viewsets.ModelViewSet,
 
     @action(detail=True, methods=['delete'])
     def remove_from_favorites(self, request, pk):
-        return self.remove_from_favorites(request, pk)
+        return self._remove_from_favorites(request, pk)
 
     @action(detail=True, methods=['post'])
     def add_to_shopping_cart(self, request, pk):
@@ -100,32 +141,30 @@ class RecipeViewSet(viewsets.ModelViewSet,
 
     @action(detail=True, methods=['delete'])
     def remove_from_shopping_cart(self, request, pk):
-        return self.remove_from_shopping_cart(request, pk)
+        return self._remove_from_shopping_cart(request, pk)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(ShoppingListTextRenderer,
+                              ShoppingListCSVRenderer,
+                              ShoppingListPDFRenderer))
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredientAmount.objects.filter(
-            recipe__in_shopping_carts__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            total_amount=Sum('amount')
-        )
-
-        data = ingredients.values_list(
+        """
+        Скачать список покупок: txt, csv или pdf
+        (параметр format или заголовок Accept).
+        """
+        data = ShoppingListItem.objects.filter(
+            user=request.user
+        ).order_by(
+            'ingredient__name'
+        ).values_list(
             'ingredient__name',
             'ingredient__measurement_unit',
-            'total_amount'
-        )
-        shopping_cart = 'Что купить:\n'
-        counter = NUMBERING
-
-        for name, measure, amount in data:
-            shopping_cart += f'{counter}. {name} - {amount} {measure},\n'
-            counter += NUMBERING
-
-        shopping_cart = shopping_cart.rstrip('\n')
+            'amount'
+        ).iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
 
-        response = HttpResponse(shopping_cart, content_type='text/plain')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(renderer.stream(data),
+                                         content_type=renderer.content_type)
+        response['Content-Disposition'] = renderer.content_disposition
         return response
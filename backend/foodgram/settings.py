@@ -40,8 +40,21 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Сбор метрик SQL-запросов и времени ответа по эндпоинтам
+API_METRICS = os.getenv('API_METRICS', default='false').lower() == 'true'
+API_METRICS_DIR = os.getenv('API_METRICS_DIR', '/tmp/foodgram_metrics')
+API_METRICS_FLUSH_INTERVAL = int(os.getenv('API_METRICS_FLUSH_INTERVAL', 10))
+
+if API_METRICS:
+    MIDDLEWARE.insert(0, 'api.middleware.QueryMetricsMiddleware')
+
 ROOT_URLCONF = 'foodgram.urls'
 
+# Асинхронные обертки для чтения рецептов, тегов и ингредиентов,
+# включать только при запуске через ASGI (foodgram.asgi)
+ASYNC_READ_PATH = os.getenv('ASYNC_READ_PATH',
+                            default='false').lower() == 'true'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -68,10 +81,81 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Время жизни соединения между запросами (секунды), 0 — новое
+        # соединение на каждый запрос
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        # pgbouncer в режиме transaction не поддерживает
+        # серверные курсоры, которые использует QuerySet.iterator()
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_POOL_MODE', '').lower() == 'pgbouncer'),
     }
 }
 
+# Реплики для чтения: хосты через запятую, остальные параметры
+# подключения как у основной базы
+REPLICA_DATABASES = []
+for number, host in enumerate(
+        filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host.strip(),
+                        'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+
+# После записи запросы клиента идут в основную базу (секунды),
+# чтобы он видел свои изменения несмотря на отставание реплик
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+# Наибольшее ожидаемое отставание реплик (секунды): данные, изменившиеся
+# позже, для кэшей по версиям читаются из основной базы
+REPLICA_MAX_LAG_SECONDS = int(
+    os.getenv('REPLICA_MAX_LAG_SECONDS', REPLICA_STICKY_SECONDS))
+
+# Заголовок с IP клиента, который выставляет nginx; без него все
+# анонимные клиенты за прокси делили бы один адрес
+CLIENT_IP_HEADER = os.getenv('CLIENT_IP_HEADER', 'HTTP_X_REAL_IP')
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+if REPLICA_DATABASES:
+    MIDDLEWARE.insert(0, 'api.middleware.ReplicaRoutingMiddleware')
+
+# Проверка постоянного соединения перед запросом, если оно простаивало
+# дольше интервала (секунды); 0 — без проверки
+DB_HEALTH_CHECK_INTERVAL = int(os.getenv('DB_HEALTH_CHECK_INTERVAL', 30))
+
+# Кэш должен быть общим для всех процессов gunicorn: в нем хранятся
+# версии данных для ETag и сброса индекса ингредиентов
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache'),
+    },
+    # Отдельный кэш аутентификации по токенам с ограниченным размером
+    'tokens': {
+        'BACKEND': os.getenv(
+            'TOKEN_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv('TOKEN_CACHE_LOCATION',
+                              '/tmp/foodgram_token_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('TOKEN_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+# Кэш сериализованных рецептов и время жизни записей (секунды)
+RECIPE_CACHE_ALIAS = os.getenv('RECIPE_CACHE_ALIAS', 'default')
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 60))
+
+# Кэш пользователей по токенам и время жизни записей (секунды)
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS', 'tokens')
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 5 * 60))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -118,7 +202,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -135,3 +219,26 @@ DJOSER = {
         'user_list': ['rest_framework.permissions.IsAuthenticatedOrReadOnly'],
     },
 }
+
+# TTF-шрифт с кириллицей для списка покупок в PDF,
+# по умолчанию — DejaVu Sans из репозитория
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    str(BASE_DIR / 'api' / 'fonts' / 'DejaVuSans.ttf')
+)
+
+# 'memory' — префиксный индекс в памяти процесса,
+# 'database' — поиск по триграммному индексу PostgreSQL
+INGREDIENT_AUTOCOMPLETE_BACKEND = os.getenv('INGREDIENT_AUTOCOMPLETE_BACKEND',
+                                            'memory')
+
+# Потоки для нарезки уменьшенных копий фото, 0 — в потоке запроса
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
+# Ограничения загружаемых фото рецептов: размер (байты) и сторона (пиксели)
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE',
+                                      5 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_SIDE = int(os.getenv('IMAGE_UPLOAD_MAX_SIDE', 6000))
+
+# Тело запроса должно вмещать фото в base64 и остальные поля рецепта
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_UPLOAD_MAX_SIZE * 4 // 3 + 1024 * 1024
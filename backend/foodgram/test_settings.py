@@ -0,0 +1,45 @@
+"""
+Настройки для тестов: две базы SQLite (основная и реплика-зеркало),
+локальный кэш и временный каталог для медиафайлов.
+
+Запуск: python manage.py test --settings=foodgram.test_settings
+"""
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, MIDDLEWARE
+
+SECRET_KEY = 'test-secret-key'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+        # Файловая база нужна тестам с параллельными потоками
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+REPLICA_DATABASES = ['replica']
+if 'api.middleware.ReplicaRoutingMiddleware' not in MIDDLEWARE:
+    MIDDLEWARE = ['api.middleware.ReplicaRoutingMiddleware', *MIDDLEWARE]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tokens',
+    },
+}
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='foodgram_test_media_')
+
+IMAGE_VARIANT_WORKERS = 0
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
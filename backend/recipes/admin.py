@@ -6,13 +6,17 @@ from .models import Recipe, Ingredient, Tag, ShoppingCart, Favorite
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     verbose_name = 'Рецепт',
-    list_display = ('id', 'name', 'author', 'count_favorites')
+    list_display = ('id', 'name', 'author', 'count_favorites',
+                    'shopping_carts_count')
     list_filter = ('author', 'name', 'tags',)
+    list_select_related = ('author',)
+    readonly_fields = ('favorites_count', 'shopping_carts_count')
 
     @staticmethod
     def count_favorites(obj):
-        return obj.in_favorites.count()
+        return obj.favorites_count
     count_favorites.short_description = 'Количество в избранном'
+    count_favorites.admin_order_field = 'favorites_count'
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,73 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Команда для потоковой выгрузки рецептов в JSON lines."""
+
+    help = ('Выгружает рецепты с тегами, ингредиентами и ссылками '
+            'на изображения построчно в формате JSON lines. '
+            'Файлы изображений из MEDIA_ROOT переносятся отдельно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Файл для выгрузки, по умолчанию stdout.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        path = options['path']
+        file = (sys.stdout if path == '-'
+                else open(path, 'w', encoding='utf-8'))
+        count = 0
+        try:
+            for recipe in self.iter_recipes(options['batch_size']):
+                file.write(json.dumps(self.serialize(recipe),
+                                      ensure_ascii=False) + '\n')
+                count += 1
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {count}.'))
+
+    @staticmethod
+    def iter_recipes(batch_size):
+        """
+        Рецепты пачками по возрастанию id: prefetch_related
+        не работает с iterator(), поэтому пагинация по ключу.
+        """
+        last_id = 0
+        while True:
+            batch = list(Recipe.objects.filter(
+                id__gt=last_id
+            ).order_by('id').with_related()[:batch_size])
+            if not batch:
+                return
+            yield from batch
+            last_id = batch[-1].id
+
+    @staticmethod
+    def serialize(recipe):
+        return {
+            'source_id': recipe.id,
+            'author': recipe.author.email,
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'image': recipe.image.name or None,
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [
+                {'name': item.ingredient.name,
+                 'measurement_unit': item.ingredient.measurement_unit,
+                 'amount': item.amount}
+                for item in recipe.recipes.all()
+            ],
+        }
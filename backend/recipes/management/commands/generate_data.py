@@ -0,0 +1,152 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.autocomplete import IngredientIndex
+from api.shopping_list_service import ShoppingListService
+from recipes.models import (Favorite,
+                            Ingredient,
+                            Recipe,
+                            RecipeIngredientAmount,
+                            ShoppingCart,
+                            Tag)
+from users.models import Subscription, User
+
+BATCH_SIZE = 1000
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+UNITS = ('гр', 'кг', 'л', 'ч.л', 'ст.л', 'щепотка', 'по вкусу')
+
+
+class Command(BaseCommand):
+    """Команда для генерации синтетических данных для бенчмарков."""
+
+    help = ('Создает пользователей, рецепты, избранное, корзины и подписки '
+            'пакетными вставками. Результат воспроизводим при одном --seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes-per-user', type=int, default=10)
+        parser.add_argument('--ingredients-per-recipe', type=int, nargs=2,
+                            default=(3, 12), metavar=('MIN', 'MAX'))
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=8)
+        parser.add_argument('--subscriptions-per-user', type=int,
+                            default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        if User.objects.filter(
+                username__startswith=f'{options["prefix"]}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {options["prefix"]} уже есть, '
+                'укажите другой --prefix.')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            tags = self.get_tags()
+            ingredient_ids = self.get_ingredient_ids()
+            users = self.create_users(options['users'], options['prefix'])
+            recipes = self.create_recipes(users, options['recipes_per_user'])
+            self.create_recipe_links(recipes, tags, ingredient_ids,
+                                     *options['ingredients_per_recipe'])
+            recipe_ids = [recipe.id for recipe in recipes]
+            user_ids = [user.id for user in users]
+            self.create_user_links(Favorite, 'recipe_id', user_ids,
+                                   recipe_ids,
+                                   options['favorites_per_user'])
+            self.create_user_links(ShoppingCart, 'recipe_id', user_ids,
+                                   recipe_ids, options['cart_per_user'])
+            self.create_user_links(Subscription, 'author_id', user_ids,
+                                   user_ids,
+                                   options['subscriptions_per_user'])
+            ShoppingListService.rebuild(batch_size=self.batch_size)
+            Recipe.objects.reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, '
+            f'рецептов: {len(recipes)}.'))
+
+    def get_tags(self):
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color})
+        return list(Tag.objects.all())
+
+    def get_ingredient_ids(self):
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if ingredient_ids:
+            return ingredient_ids
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=f'Ингредиент {number}',
+                        measurement_unit=self.rng.choice(UNITS))
+             for number in range(2000)],
+            batch_size=self.batch_size)
+        IngredientIndex.invalidate()
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_users(self, count, prefix):
+        password = make_password(prefix)
+        User.objects.bulk_create(
+            [User(username=f'{prefix}_{number}',
+                  email=f'{prefix}_{number}@example.com',
+                  first_name='Имя',
+                  last_name='Фамилия',
+                  password=password)
+             for number in range(count)],
+            batch_size=self.batch_size)
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_').order_by('id'))
+
+    def create_recipes(self, users, per_user):
+        Recipe.objects.bulk_create(
+            [Recipe(author=user,
+                    name=f'Рецепт {user.username} {number}',
+                    text='Описание рецепта. ' * self.rng.randint(1, 20),
+                    cooking_time=self.rng.randint(5, 180))
+             for user in users
+             for number in range(per_user)],
+            batch_size=self.batch_size)
+        return list(Recipe.objects.filter(
+            author__in=users).order_by('id').only('id'))
+
+    def create_recipe_links(self, recipes, tags, ingredient_ids,
+                            min_ingredients, max_ingredients):
+        through = Recipe.tags.through
+        tag_links = []
+        amounts = []
+        for recipe in recipes:
+            for tag in self.rng.sample(tags,
+                                       self.rng.randint(1, len(tags))):
+                tag_links.append(through(recipe_id=recipe.id, tag_id=tag.id))
+            count = min(self.rng.randint(min_ingredients, max_ingredients),
+                        len(ingredient_ids))
+            for ingredient_id in self.rng.sample(ingredient_ids, count):
+                amounts.append(RecipeIngredientAmount(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient_id,
+                    amount=self.rng.randint(1, 500)))
+        through.objects.bulk_create(tag_links, batch_size=self.batch_size)
+        RecipeIngredientAmount.objects.bulk_create(
+            amounts, batch_size=self.batch_size)
+
+    def create_user_links(self, model, target_field, user_ids, target_ids,
+                          per_user):
+        links = []
+        for user_id in user_ids:
+            candidates = [target for target in self.rng.sample(
+                target_ids, min(per_user + 1, len(target_ids)))
+                if target != user_id or target_field != 'author_id']
+            count = self.rng.randint(0, min(per_user, len(candidates)))
+            links.extend(model(user_id=user_id, **{target_field: target})
+                         for target in candidates[:count])
+        model.objects.bulk_create(links, batch_size=self.batch_size)
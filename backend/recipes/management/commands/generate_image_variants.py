@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api.image_service import ImageVariantService
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Команда для нарезки уменьшенных копий фото рецептов."""
+
+    help = ('Нарезает уменьшенные копии фото рецептов, у которых их '
+            'еще нет (или всех с --all), в текущем процессе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать копии для всех рецептов.')
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        done = failed = 0
+        for recipe_id, image_name in recipes.values_list(
+                'id', 'image').iterator():
+            try:
+                ImageVariantService.process(recipe_id, image_name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                continue
+            done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {done}, с ошибками: {failed}.'))
@@ -0,0 +1,222 @@
+import json
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils.dateparse import parse_datetime
+
+from api.autocomplete import IngredientIndex
+from recipes.models import Ingredient, Recipe, RecipeIngredientAmount, Tag
+from users.models import User
+
+BATCH_SIZE = 200
+
+
+class Command(BaseCommand):
+    """Команда для импорта рецептов из JSON lines (см. export_recipes)."""
+
+    help = ('Импортирует рецепты пачками, каждая в своей транзакции. '
+            'После каждой пачки номер строки сохраняется в файл '
+            'контрольной точки, повторный запуск продолжает с него. '
+            'Рецепты с уже существующей парой (автор, название) '
+            'и некорректные строки пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки, по умолчанию <path>.checkpoint.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать с начала файла.')
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        checkpoint = Path(options['checkpoint']
+                          or f'{path}.checkpoint')
+        start = 0
+        if checkpoint.exists() and not options['restart']:
+            start = json.loads(checkpoint.read_text())['line']
+            self.stdout.write(f'Продолжение со строки {start}.')
+
+        self.stats = dict.fromkeys(
+            ('created', 'existing', 'unknown_author', 'invalid'), 0)
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        batch = []
+        with open(path, encoding='utf-8') as file:
+            for number, line in enumerate(file):
+                if number < start or not line.strip():
+                    continue
+                try:
+                    batch.append(self.parse_item(line))
+                except (ValueError, KeyError, TypeError) as error:
+                    self.stats['invalid'] += 1
+                    self.stderr.write(
+                        f'Строка {number + 1} пропущена: {error!r}.')
+                    continue
+                if len(batch) == options['batch_size']:
+                    self.import_batch(batch)
+                    self.save_checkpoint(checkpoint, number + 1)
+                    batch = []
+            if batch:
+                self.import_batch(batch)
+        checkpoint.unlink(missing_ok=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Импорт завершен: создано {created}, уже существовало '
+            '{existing}, без автора {unknown_author}, '
+            'некорректных {invalid}.'.format(**self.stats)))
+
+    @staticmethod
+    def parse_item(line):
+        """
+        Разбирает строку файла в рецепт с полями нужных типов.
+        Ошибки формата строки — ValueError, KeyError или TypeError.
+        """
+        item = json.loads(line)
+        if not isinstance(item, dict):
+            raise TypeError('Строка должна содержать объект JSON')
+        pub_date = item.get('pub_date')
+        if pub_date:
+            pub_date = parse_datetime(pub_date)
+            if pub_date is None:
+                raise ValueError(f'Некорректная дата: {item["pub_date"]}')
+        return {
+            'author': str(item['author']),
+            'name': str(item['name']),
+            'text': str(item['text']),
+            'cooking_time': item['cooking_time'],
+            'image': item.get('image') or None,
+            'pub_date': pub_date or None,
+            'tags': [str(slug) for slug in item.get('tags') or ()],
+            'ingredients': [
+                {'name': str(ingredient['name']),
+                 'measurement_unit': str(ingredient['measurement_unit']),
+                 'amount': ingredient['amount']}
+                for ingredient in item['ingredients']],
+        }
+
+    def save_checkpoint(self, checkpoint, line):
+        temporary = checkpoint.with_suffix('.tmp')
+        temporary.write_text(json.dumps({'line': line}))
+        temporary.replace(checkpoint)
+        self.stdout.write(f'Обработано строк: {line}.')
+
+    @transaction.atomic
+    def import_batch(self, items):
+        authors = dict(User.objects.filter(
+            email__in={item['author'] for item in items}
+        ).values_list('email', 'id'))
+        ingredients = self.get_ingredients(items)
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={item['name'] for item in items}
+        ).values_list('author_id', 'name'))
+
+        recipes = []
+        for item in items:
+            author_id = authors.get(item['author'])
+            if author_id is None:
+                self.stats['unknown_author'] += 1
+                continue
+            if (author_id, item['name']) in existing:
+                self.stats['existing'] += 1
+                continue
+            recipe = Recipe(author_id=author_id,
+                            name=item['name'],
+                            text=item['text'],
+                            cooking_time=item['cooking_time'],
+                            image=item['image'])
+            amounts = {}
+            for ingredient in item['ingredients']:
+                ingredient_id = ingredients[(ingredient['name'],
+                                             ingredient['measurement_unit'])]
+                amounts[ingredient_id] = RecipeIngredientAmount(
+                    ingredient_id=ingredient_id,
+                    amount=ingredient['amount'])
+            amounts = list(amounts.values())
+            try:
+                recipe.clean_fields(exclude=('author', 'image'))
+                for amount in amounts:
+                    amount.clean_fields(exclude=('recipe', 'ingredient'))
+            except ValidationError:
+                self.stats['invalid'] += 1
+                continue
+            existing.add((author_id, item['name']))
+            recipes.append((recipe, item, amounts))
+
+        self.create_recipes([recipe for recipe, _, _ in recipes])
+        self.restore_pub_dates(recipes)
+        self.create_links(recipes)
+        self.stats['created'] += len(recipes)
+
+    @staticmethod
+    def get_ingredients(items):
+        """
+        Ингредиенты по естественному ключу, недостающие создаются.
+        bulk_create не отправляет сигналы, поэтому индекс автодополнения
+        и версия ингредиентов для ETag сбрасываются после фиксации пачки.
+        """
+        keys = {(ingredient['name'], ingredient['measurement_unit'])
+                for item in items for ingredient in item['ingredients']}
+
+        def fetch():
+            return {
+                (name, unit): pk
+                for pk, name, unit in Ingredient.objects.filter(
+                    name__in={name for name, _ in keys}
+                ).values_list('id', 'name', 'measurement_unit')
+                if (name, unit) in keys
+            }
+
+        ingredients = fetch()
+        missing = keys - ingredients.keys()
+        if missing:
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in missing],
+                ignore_conflicts=True)
+            transaction.on_commit(IngredientIndex.invalidate)
+            ingredients = fetch()
+        return ingredients
+
+    @staticmethod
+    def create_recipes(recipes):
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            return
+        for recipe in recipes:
+            recipe.save()
+
+    @staticmethod
+    def restore_pub_dates(recipes):
+        """
+        pub_date с auto_now_add перезаписывается при вставке,
+        исходные даты возвращаются одним UPDATE.
+        """
+        dates = [When(pk=recipe.pk, then=Value(item['pub_date']))
+                 for recipe, item, _ in recipes if item['pub_date']]
+        if dates:
+            Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe, _, _ in recipes]
+            ).update(pub_date=Case(*dates, default='pub_date',
+                                   output_field=DateTimeField()))
+
+    def create_links(self, recipes):
+        through = Recipe.tags.through
+        tag_links = []
+        amounts = []
+        for recipe, item, recipe_amounts in recipes:
+            tag_links.extend(
+                through(recipe_id=recipe.pk, tag_id=self.tags[slug])
+                for slug in set(item['tags']) if slug in self.tags)
+            for amount in recipe_amounts:
+                amount.recipe_id = recipe.pk
+                amounts.append(amount)
+        through.objects.bulk_create(tag_links)
+        RecipeIngredientAmount.objects.bulk_create(amounts)
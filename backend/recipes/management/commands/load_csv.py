@@ -1,43 +1,189 @@
 import csv
-from django.core.management.base import BaseCommand
-from django.db import transaction
+import io
+import json
+from itertools import islice
+from pathlib import Path
 
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.autocomplete import IngredientIndex
 from recipes.models import Ingredient
 
 BATCH_SIZE = 1000
+DEFAULT_PATH = 'data/ingredients.csv'
+FORMATS = ('csv', 'json', 'jsonl')
+READ_CHUNK_SIZE = 65536
+
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) != 2 or row == ['name', 'measurement_unit']:
+            yield None
+            continue
+        yield row
+
+
+def read_json_array(file):
+    """
+    Потоковое чтение JSON-массива объектов без загрузки файла целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON.')
+                break
+            yield item
+        if not chunk:
+            return
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+READERS = {'csv': read_csv, 'json': read_json_array, 'jsonl': read_jsonl}
+
+
+def normalize(item):
+    """
+    Пара (название, единица измерения) или None для некорректной записи.
+    """
+    if isinstance(item, dict):
+        item = item.get('name'), item.get('measurement_unit')
+    if not item:
+        return None
+    name, unit = item
+    if not isinstance(name, str) or not isinstance(unit, str):
+        return None
+    name, unit = name.strip(), unit.strip()
+    if not name or not unit or len(name) > NAME_LENGTH or (
+            len(unit) > UNIT_LENGTH):
+        return None
+    return name, unit
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
 
 
 class Command(BaseCommand):
-    """Команда для импорта ингредиентов из CSV-файла."""
+    """Команда для импорта ингредиентов из CSV, JSON или JSON lines."""
+
+    help = ('Идемпотентно импортирует ингредиенты: существующие пары '
+            '(название, единица измерения) пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--format', choices=FORMATS,
+                            help='По умолчанию определяется по расширению.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
 
-    @transaction.atomic
     def handle(self, *args, **options):
-        """Обработка выполнения команды
-        и импорт ингредиентов из CSV-файла."""
-
-        with open('data/ingredients.csv') as f:
-            reader = csv.reader(f)
-
-            ingredients = []
-            row_num = 0
-            for row in reader:
-                name, unit = row
-                ingredients.append(Ingredient(name=name,
-                                              measurement_unit=unit))
-
-                row_num += 1
-                if row_num % BATCH_SIZE == 0:
-                    self.stdout.write('Импорт пакета ингредиентов...')
-                    Ingredient.objects.bulk_create(ingredients,
-                                                   ignore_conflicts=True)
-                    ingredients = []
-
-            if ingredients:
-                Ingredient.objects.bulk_create(ingredients,
-                                               ignore_conflicts=True)
-
-        self.stdout.write(
-            self.style.SUCCESS(
-                'Ингредиенты успешно импортированы!'
-            )
-        )
+        """Обработка выполнения команды и импорт ингредиентов."""
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(
+                f'Неизвестный формат {file_format}, укажите --format.')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+
+        self.invalid = 0
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            rows = self.valid_rows(READERS[file_format](file))
+            if connection.vendor == 'postgresql':
+                read, inserted = self.copy_rows(rows, options['batch_size'])
+            else:
+                read, inserted = self.insert_rows(rows,
+                                                  options['batch_size'])
+
+        if inserted:
+            IngredientIndex.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиенты импортированы: добавлено {inserted}, '
+            f'пропущено существующих или повторов '
+            f'{read - inserted}, пропущено некорректных {self.invalid}.'))
+
+    def valid_rows(self, items):
+        for item in items:
+            row = normalize(item)
+            if row is None:
+                self.invalid += 1
+                continue
+            yield row
+
+    def insert_rows(self, rows, batch_size):
+        """
+        Вставка пачками с ON CONFLICT DO NOTHING: число добавленных
+        строк берется из rowcount вставки, без подсчета таблицы.
+        """
+        table = Ingredient._meta.db_table
+        read = inserted = 0
+        with connection.cursor() as cursor:
+            for batch in batches(rows, batch_size):
+                read += len(batch)
+                cursor.executemany(
+                    f'INSERT INTO {table} (name, measurement_unit) '
+                    'VALUES (%s, %s) '
+                    'ON CONFLICT (name, measurement_unit) DO NOTHING',
+                    list(dict.fromkeys(batch)))
+                inserted += cursor.rowcount
+                self.stdout.write(f'Обработано строк: {read}.')
+        return read, inserted
+
+    def copy_rows(self, rows, batch_size):
+        """
+        Загрузка через COPY во временную таблицу и одна вставка
+        с ON CONFLICT DO NOTHING по естественному ключу.
+        """
+        table = Ingredient._meta.db_table
+        read = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                f'(name varchar({NAME_LENGTH}), '
+                f'measurement_unit varchar({UNIT_LENGTH})) '
+                'ON COMMIT DROP')
+            for batch in batches(rows, batch_size):
+                read += len(batch)
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)', buffer)
+                self.stdout.write(f'Обработано строк: {read}.')
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING')
+            return read, cursor.rowcount
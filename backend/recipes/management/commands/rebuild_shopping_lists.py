@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.shopping_list_service import ShoppingListService
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Команда для пересборки и проверки агрегированных списков покупок."""
+
+    help = ('Пересобирает таблицу ShoppingListItem по корзинам '
+            'или сверяет ее с ними (--verify).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить списки покупок, не изменяя их.'
+        )
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        if not options['verify']:
+            count = ShoppingListService.rebuild(batch_size=BATCH_SIZE)
+            self.stdout.write(self.style.SUCCESS(
+                f'Списки покупок пересобраны: {count} позиций.'))
+            return
+
+        live = ShoppingListService.get_live_totals()
+        stored = ShoppingListService.get_stored_totals()
+        mismatches = {key for key in live.keys() | stored.keys()
+                      if live.get(key) != stored.get(key)}
+        for user_id, ingredient_id in sorted(mismatches):
+            key = (user_id, ingredient_id)
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'ожидается {live.get(key, 0)}, '
+                f'сохранено {stored.get(key, 0)}')
+        if mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {len(mismatches)}. '
+                'Запустите команду без --verify для пересборки.')
+        self.stdout.write(self.style.SUCCESS(
+            'Списки покупок совпадают с корзинами.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Команда для сверки счетчиков избранного и корзин у рецептов."""
+
+    help = ('Пересчитывает favorites_count и shopping_carts_count '
+            'рецептов по связям. Предназначена для периодического запуска.')
+
+    def handle(self, *args, **options):
+        """Обработка выполнения команды."""
+        fixed = Recipe.objects.reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики рецептов сверены, исправлено: {fixed}.'))
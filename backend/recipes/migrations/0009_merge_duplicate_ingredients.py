@@ -0,0 +1,65 @@
+# Generated by Django 3.2.19 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+# Значение api.constants.MAX_AMOUNT на момент миграции
+MAX_AMOUNT = 1000
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredientAmount = apps.get_model('recipes',
+                                            'RecipeIngredientAmount')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=models.Min('id'),
+        total=models.Count('id')
+    ).filter(total__gt=1).order_by()
+    for group in duplicates:
+        keep_id = group['keep_id']
+        extra_ids = list(Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit']
+        ).exclude(id=keep_id).values_list('id', flat=True))
+        # Списки покупок объединяются первыми, чтобы затем вычесть
+        # из них то, что срезано при ограничении количества в рецепте
+        for model, owner in ((ShoppingListItem, 'user_id'),
+                             (RecipeIngredientAmount, 'recipe_id')):
+            for row in model.objects.filter(ingredient_id__in=extra_ids):
+                kept = model.objects.filter(
+                    ingredient_id=keep_id,
+                    **{owner: getattr(row, owner)}).first()
+                if kept is None:
+                    row.ingredient_id = keep_id
+                    row.save(update_fields=['ingredient'])
+                    continue
+                kept.amount += row.amount
+                excess = 0
+                if model is RecipeIngredientAmount:
+                    excess = max(kept.amount - MAX_AMOUNT, 0)
+                    kept.amount -= excess
+                kept.save(update_fields=['amount'])
+                row.delete()
+                if excess:
+                    ShoppingListItem.objects.filter(
+                        ingredient_id=keep_id,
+                        user_id__in=ShoppingCart.objects.filter(
+                            recipe_id=kept.recipe_id).values('user_id')
+                    ).update(amount=models.F('amount') - excess)
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+    ]
@@ -1,10 +1,15 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import (BooleanField, Count, Exists, F, IntegerField,
+                              OuterRef, Prefetch, Q, Subquery, Value)
+from django.db.models.functions import Coalesce
 from django.core.validators import (RegexValidator,
                                     MaxValueValidator,
                                     MinValueValidator)
 
-from api.constants import MAX_AMOUNT, MAX_TIME, MINIMUM
+from api.constants import (MAX_AMOUNT, MAX_TIME, MINIMUM,
+                           RECONCILE_BATCH_SIZE)
+from api.versions import bump_version, recipe_counters_key
 
 measurement_unit_validator = RegexValidator(
     regex=r'^(гр|л|кг|ч\.л|ст\.л|щепотка|по вкусу)$',
@@ -25,6 +30,10 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='ingredient_name_unit_unique')]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -58,6 +67,93 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """
+    Набор запросов рецептов с аннотациями для текущего пользователя.
+    """
+
+    @staticmethod
+    def related_lookups():
+        """
+        Связи рецепта, которые подгружаются для его отображения.
+        """
+        return [
+            'tags',
+            Prefetch(
+                'recipes',
+                queryset=RecipeIngredientAmount.objects.select_related(
+                    'ingredient')
+            )
+        ]
+
+    def with_related(self):
+        """
+        Подгружает автора, теги и ингредиенты рецептов
+        фиксированным числом запросов независимо от размера страницы.
+        API подгружает те же связи только при промахе кэша
+        представлений, см. FullRecipeSerializer.to_representation_many.
+        """
+        return self.select_related('author').prefetch_related(
+            *self.related_lookups())
+
+    @staticmethod
+    def live_counters():
+        """
+        Выражения для подсчета избранного и корзин рецепта по связям.
+        """
+        def count_of(model):
+            return Coalesce(Subquery(
+                model.objects.filter(
+                    recipe=OuterRef('pk')
+                ).order_by().values('recipe').annotate(
+                    total=Count('pk')
+                ).values('total'),
+                output_field=IntegerField()
+            ), 0)
+        return {'favorites_count': count_of(Favorite),
+                'shopping_carts_count': count_of(ShoppingCart)}
+
+    def reconcile_counters(self):
+        """
+        Сверяет счетчики рецептов со связями и исправляет расхождения.
+        Версии счетчиков исправленных рецептов меняются, чтобы
+        условные запросы не отвечали 304 со старыми счетчиками.
+        Возвращает количество исправленных рецептов.
+        """
+        live = self.live_counters()
+        stale_ids = list(self.annotate(
+            live_favorites_count=live['favorites_count'],
+            live_shopping_carts_count=live['shopping_carts_count']
+        ).filter(
+            ~Q(favorites_count=F('live_favorites_count'))
+            | ~Q(shopping_carts_count=F('live_shopping_carts_count'))
+        ).values_list('pk', flat=True))
+        fixed = 0
+        for start in range(0, len(stale_ids), RECONCILE_BATCH_SIZE):
+            batch = stale_ids[start:start + RECONCILE_BATCH_SIZE]
+            fixed += self.model.objects.filter(pk__in=batch).update(**live)
+            for recipe_id in batch:
+                bump_version(recipe_counters_key(recipe_id))
+        return fixed
+
+    def with_user_flags(self, user):
+        """
+        Аннотирует рецепты признаками нахождения в избранном
+        и в корзине покупок пользователя одним запросом на страницу.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -75,6 +171,11 @@ class Recipe(models.Model):
         null=True,
         verbose_name='Фото'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Уменьшенные копии фото'
+    )
     text = models.TextField(
         verbose_name='Описание'
     )
@@ -99,9 +200,25 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество в избранном'
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество в списках покупок'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=('author', '-pub_date'),
+                         name='recipe_author_pub_date_idx'),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -167,6 +284,10 @@ class ShoppingCart(models.Model):
             models.UniqueConstraint(
                 fields=('recipe', 'user'),
                 name='shopping_cart_recipe_unique')]
+        indexes = [
+            models.Index(fields=('user', 'recipe'),
+                         name='shopping_cart_user_recipe_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user}:{self.recipe}'
@@ -197,6 +318,40 @@ class Favorite(models.Model):
             models.UniqueConstraint(
                 fields=('recipe', 'user'),
                 name='favorite_recipe_unique')]
+        indexes = [
+            models.Index(fields=('user', 'recipe'),
+                         name='favorite_user_recipe_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user}:{self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list_items'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items'
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Общее количество'
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='shopping_list_item_unique')]
+
+    def __str__(self):
+        return f'{self.user}:{self.ingredient} - {self.amount}'
@@ -0,0 +1,150 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.autocomplete import ingredient_index
+from api.versions import get_versions, recipe_counters_key, version_key
+from users.models import User
+from .models import Favorite, Ingredient, Recipe
+
+
+class ImportRecipesTests(TestCase):
+    """Импорт рецептов командой import_recipes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password', first_name='Имя', last_name='Фамилия')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def import_recipes(self, items, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / 'recipes.jsonl'
+        path.write_text('\n'.join(
+            item if isinstance(item, str)
+            else json.dumps(item, ensure_ascii=False)
+            for item in items), encoding='utf-8')
+        stdout = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_recipes', str(path), stdout=stdout,
+                         stderr=StringIO(), **options)
+        return stdout.getvalue()
+
+    def get_item(self, name, **fields):
+        return {'source_id': 1, 'author': self.author.email, 'name': name,
+                'text': 'Описание', 'cooking_time': 10, 'tags': [],
+                'ingredients': [{'name': 'соль', 'measurement_unit': 'г',
+                                 'amount': 5}],
+                **fields}
+
+    def test_malformed_lines_are_skipped(self):
+        without_ingredients = self.get_item('Без ингредиентов')
+        del without_ingredients['ingredients']
+        output = self.import_recipes([
+            '{"author": ',
+            without_ingredients,
+            '["не", "объект"]',
+            self.get_item('Плохая дата', pub_date='вчера'),
+            self.get_item('Плохое количество', ingredients=[{'name': 'соль'}]),
+            self.get_item('Суп'),
+            self.get_item('Каша'),
+        ], batch_size=1)
+        self.assertIn('создано 2', output)
+        self.assertIn('некорректных 5', output)
+        self.assertEqual(
+            set(Recipe.objects.values_list('name', flat=True)),
+            {'Суп', 'Каша'})
+
+    def test_new_ingredients_reset_index_and_version(self):
+        self.assertEqual(
+            [item.name for item in ingredient_index.search('шаф', 10)],
+            [])
+        version, = get_versions(version_key(Ingredient))
+        self.import_recipes([{
+            'source_id': 1, 'author': self.author.email, 'name': 'Плов',
+            'text': 'Описание', 'cooking_time': 60,
+            'pub_date': '2023-01-01T00:00:00+00:00',
+            'image': 'recipes/images/plov.png', 'tags': [],
+            'ingredients': [
+                {'name': 'соль', 'measurement_unit': 'г', 'amount': 5},
+                {'name': 'шафран', 'measurement_unit': 'г', 'amount': 1},
+            ],
+        }])
+        self.assertTrue(Recipe.objects.filter(name='Плов').exists())
+        self.assertNotEqual(get_versions(version_key(Ingredient)),
+                            [version])
+        self.assertEqual(
+            [item.name for item in ingredient_index.search('шаф', 10)],
+            ['шафран'])
+
+
+class LoadCsvTests(TestCase):
+    """Импорт ингредиентов командой load_csv."""
+
+    def load_csv(self, text, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / 'ingredients.csv'
+        path.write_text(text, encoding='utf-8')
+        stdout = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('load_csv', str(path), stdout=stdout, **options)
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'COUNT(' in query['sql'].upper()])
+        return stdout.getvalue()
+
+    def test_inserted_rows_counted_from_inserts(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        output = self.load_csv(
+            'соль,г\nсахар,г\nсахар,г\nмука,г\nбез единицы\n',
+            batch_size=2)
+        self.assertIn('добавлено 2,', output)
+        self.assertIn('повторов 2,', output)
+        self.assertIn('некорректных 1.', output)
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+
+class ReconcileCountersTests(TestCase):
+    """Исправление счетчиков рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password', first_name='Имя', last_name='Фамилия')
+        cls.stale, cls.correct = [
+            Recipe.objects.create(author=cls.author, name=f'Рецепт {number}',
+                                  text='Описание', cooking_time=10,
+                                  image='recipes/images/test.png')
+            for number in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def get_favorites_count(self, recipe):
+        return self.client.get(
+            f'/api/recipes/{recipe.pk}/').json()['favorites_count']
+
+    def test_cached_payload_is_refreshed(self):
+        self.assertEqual(self.get_favorites_count(self.stale), 0)
+        # Связь в обход сигналов: счетчик расходится с данными
+        Favorite.objects.bulk_create([Favorite(user=self.author,
+                                               recipe=self.stale)])
+        self.assertEqual(self.get_favorites_count(self.stale), 0)
+        correct_version = get_versions(
+            recipe_counters_key(self.correct.pk))
+
+        self.assertEqual(Recipe.objects.reconcile_counters(), 1)
+        self.assertEqual(self.get_favorites_count(self.stale), 1)
+        self.assertEqual(
+            get_versions(recipe_counters_key(self.correct.pk)),
+            correct_version)